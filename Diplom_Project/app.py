@@ -1,49 +1,106 @@
+import time
+APP_START = time.perf_counter()  # Reference point for time-to-first-UI / time-to-first-frame
+
 import gradio as gr
 from core.translator import Translator
 from core.text_processing import TextProcessor
-from core.generator import ImageGenerator
-from core.storyteller import StoryTeller
 from core.prompt_engineering import PromptEngineer
 from core.session_manager import SessionManager
+from core.schedulers import SCHEDULERS
+from core.profiles import SPEED_PROFILES
+from core.story_context import StoryContext
+from core.model_loader import ModelLoader
 from utils.config import config
 from utils.logger import app_logger
+from PIL import Image
 import os
+import queue
 import random
+import threading
 import uuid
 
 # Инициализация модулей
 translator = Translator()
 text_processor = TextProcessor()
-generator = ImageGenerator(low_memory_mode=True)  # Enable low memory mode for 8GB RAM
-storyteller = StoryTeller(model_name="ai-forever/rugpt3small_based_on_gpt2", device="cpu") 
 prompt_engineer = PromptEngineer()
 session_manager = SessionManager(storage_path=config.get("paths.sessions_dir", "sessions"))
 
+# Heavy models (torch, diffusers, transformers) are imported and loaded on background
+# threads, so the UI binds before they are ready. Handlers wait for them in models.get().
+def load_image_generator():
+    from core.generator import ImageGenerator
+    image_generator = ImageGenerator(low_memory_mode=True)  # Enable low memory mode for 8GB RAM
+    image_generator.load_model()
+    return image_generator
+
+def load_storyteller():
+    from core.storyteller import StoryTeller
+    return StoryTeller(model_name="ai-forever/rugpt3small_based_on_gpt2", device="cpu")
+
+models = ModelLoader()
+models.register("generator", load_image_generator)
+models.register("storyteller", load_storyteller)
+models.start()
+if not config.get("startup.background_warmup", True):
+    models.wait_all()
+
+MODELS_LOADING_MESSAGE = "⏳ Модели ещё загружаются, запрос поставлен в очередь..."
+startup_metrics = {"first_ui": None, "first_frame": None}
+
+def models_status_markdown():
+    """Readiness/health line shown in the UI."""
+    labels = {"generator": "Stable Diffusion", "storyteller": "StoryTeller"}
+    icons = {"loading": "⏳", "ready": "✅"}
+    parts = []
+    for name, state in models.status().items():
+        icon = icons.get(state, "❌")
+        load_time = f" ({models.load_times[name]:.0f} с)" if name in models.load_times else ""
+        parts.append(f"{icon} {labels.get(name, name)}: {state}{load_time}")
+    return "**Статус моделей:** " + " | ".join(parts)
+
 # Глобальное состояние
 class SessionState:
     def __init__(self):
         self.session_id = str(uuid.uuid4())
-        self.history = ""
+        self.context = StoryContext()  # Header, chat turns and rolling summary
         self.current_seed = -1
         self.char_desc = ""
         self.style = ""
         self.images = []
+        self.frames = []  # Per image: prompt, negative_prompt, seed, latents (see ImageGenerator.last_frames)
+        self.draft_mode = False
+        self.selected_frame = None  # Index into the gallery
+        self.gallery_offset = 0  # Index in self.images of the first image shown in the gallery
         self.educational_mode = False
+        self.scheduler = None
+        self.profile = None
 
     def reset(self):
         self.session_id = str(uuid.uuid4())
-        self.history = ""
+        self.context = StoryContext()
         self.current_seed = random.randint(0, 1000000) if not self.educational_mode else self.current_seed
         self.char_desc = ""
         self.style = ""
         self.images = []
+        self.frames = []
+        self.selected_frame = None
+        self.gallery_offset = 0
+
+    @property
+    def history(self):
+        """Plain-text transcript, as stored in session files."""
+        return self.context.render()
 
 session = SessionState()
 
-def generate_sequence(base_prompt_ru, character, style, count=3, educational_mode=False):
-    """Generates a sequence of related images."""
-    images = []
-    
+# Set by the stop button; checked by the generator between denoising steps
+cancel_event = threading.Event()
+
+def build_sequence_prompts(base_prompt_ru, character, style, count=3, educational_mode=False, cancel_event=None):
+    """
+    Builds and translates the prompts of a sequence.
+    Returns (prompts, negative_prompts, seeds, is_split_narrative), or None if cancelled.
+    """
     # Base extraction
     visual_text = text_processor.extract_visual_part(base_prompt_ru)
     is_split_narrative = False
@@ -63,7 +120,7 @@ def generate_sequence(base_prompt_ru, character, style, count=3, educational_mod
     # IT-specific variations based on style and content
     elif educational_mode:
         app_logger.info(f"Generating storyboard for: {character} using style {style}")
-        variations = storyteller.generate_visual_storyboard(character, style, count)
+        variations = models.get("storyteller").generate_visual_storyboard(character, style, count)
         if not variations or len(variations) < count:
              variations = ["informational diagram", "detailed schematic", "process flow", "summary result"]
     elif style == "Algorithm Flowchart":
@@ -76,7 +133,13 @@ def generate_sequence(base_prompt_ru, character, style, count=3, educational_mod
     else:
         variations = ["cinematic shot", "action shot, dynamic", "close up"]
     
+    prompts = []
+    negative_prompts = []
+    seeds = []
     for i in range(count):
+        if cancel_event is not None and cancel_event.is_set():
+            app_logger.info("Generation cancelled before rendering")
+            return None
         variation = variations[i % len(variations)]
         
         # Prompt Logic:
@@ -97,16 +160,6 @@ def generate_sequence(base_prompt_ru, character, style, count=3, educational_mod
             educational_mode=educational_mode
         )
         
-        en_prompt = translator.translate(complex_prompt)
-        # Ensure 'high quality' is strictly enforced
-        if "high quality" not in en_prompt.lower():
-            en_prompt += ", high quality, 8k, masterpiece"
-            
-        en_negative_prompt = translator.translate(negative_prompt) if negative_prompt else ""
-        app_logger.info(f"Generating frame {i+1}: {en_prompt}")
-        if en_negative_prompt:
-            app_logger.info(f"Negative prompt: {en_negative_prompt}")
-        
         # Seed Logic:
         # For Narratives/Comics, use the SAME seed for all frames to keep character/style consistent.
         # For Topics, vary the seed to show different details/layouts.
@@ -115,28 +168,175 @@ def generate_sequence(base_prompt_ru, character, style, count=3, educational_mod
         else:
              scene_seed = session.current_seed + i if session.current_seed != -1 else None
 
-        img = generator.generate(en_prompt, negative_prompt=en_negative_prompt, seed=scene_seed, educational_mode=educational_mode)
-        images.append(img)
-        
+        prompts.append(complex_prompt)
+        negative_prompts.append(negative_prompt or "")
+        seeds.append(scene_seed)
+
+    # All prompts and negative prompts of the sequence are translated in one batch
+    translated = translator.translate_batch(prompts + negative_prompts)
+    prompts, negative_prompts = translated[:count], translated[count:]
+    for i, en_prompt in enumerate(prompts):
+        # Ensure 'high quality' is strictly enforced
+        if "high quality" not in en_prompt.lower():
+            prompts[i] = en_prompt + ", high quality, 8k, masterpiece"
+        app_logger.info(f"Generating frame {i+1}: {prompts[i]}")
+        if negative_prompts[i]:
+            app_logger.info(f"Negative prompt: {negative_prompts[i]}")
+
+    return prompts, negative_prompts, seeds, is_split_narrative
+
+def generate_sequence(base_prompt_ru, character, style, count=3, educational_mode=False, batched=True, scheduler=None, on_preview=None, cancel_event=None, profile=None, frames_out=None, draft=False):
+    """
+    Generates a sequence of related images.
+    If frames_out is a list, the frames' records (prompt, seed, latents...) are appended to it.
+    draft renders small fast drafts meant to be upscaled once accepted.
+    """
+    images = []
+    
+    built = build_sequence_prompts(base_prompt_ru, character, style, count=count, educational_mode=educational_mode, cancel_event=cancel_event)
+    if built is None:
+        return images
+    prompts, negative_prompts, seeds, is_split_narrative = built
+
+    # Comic frames share the anchor and composition, so frames 2..N continue from the
+    # previous frame's latents (img2img) instead of starting from noise
+    continuation_strength = config.get("generation.continuation_strength") if is_split_narrative else None
+
+    # Draft mode: small frames with a reduced step budget now, compute goes to
+    # upscaling the accepted ones later
+    size = config.get("generation.draft_size", 256) if draft else config.get("generation.default_height", 512)
+
+    generator = models.get("generator")
+    steps = None
+    if draft:
+        scheduler_steps = generator.get_scheduler_steps(generator.set_scheduler(scheduler or generator.scheduler_name))
+        steps = max(2, round(scheduler_steps * config.get("generation.draft_step_fraction", 0.6)))
+    if batched or continuation_strength:
+        # All frames of the sequence share one batched denoising loop (or one continuation chain)
+        images = generator.generate_batch(prompts, negative_prompts, seeds, height=size, width=size, steps=steps, educational_mode=educational_mode, scheduler=scheduler, on_preview=on_preview, cancel_event=cancel_event, profile=profile, continuation_strength=continuation_strength)
+        frames = list(generator.last_frames)
+    else:
+        frames = []
+        for i, (en_prompt, en_negative_prompt, scene_seed) in enumerate(zip(prompts, negative_prompts, seeds)):
+            frame_preview = None
+            if on_preview:
+                frame_preview = lambda _, previews, step, total, i=i: on_preview([i], previews, step, total)
+            img = generator.generate(en_prompt, negative_prompt=en_negative_prompt, seed=scene_seed, height=size, width=size, steps=steps, educational_mode=educational_mode, scheduler=scheduler, on_preview=frame_preview, cancel_event=cancel_event, profile=profile)
+            if img is None:
+                break
+            images.append(img)
+            frames.extend(generator.last_frames)
+
+    if frames_out is not None:
+        frames_out.extend(frames)
     return images
 
-def start_story(character_input, style_input, educational_mode, scene_count):
+def stream_sequence(*args, **kwargs):
+    """
+    Runs generate_sequence on a worker thread and yields (images, finished) pairs.
+    While frames are denoising, images holds the latest preview of every frame;
+    the last pair carries the finished sequence.
+    """
+    updates = queue.Queue()
+    outcome = {}
+
+    def on_preview(indices, previews, step, total_steps):
+        updates.put((indices, previews))
+
+    def worker():
+        try:
+            outcome["images"] = generate_sequence(*args, on_preview=on_preview, **kwargs)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            updates.put(None)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    frames = {}
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+        indices, previews = update
+        frames.update(zip(indices, previews))
+        yield [frames[i] for i in sorted(frames)], False
+
+    if "error" in outcome:
+        raise outcome["error"]
+    if startup_metrics["first_frame"] is None and outcome["images"]:
+        startup_metrics["first_frame"] = time.perf_counter() - APP_START
+        app_logger.info(f"Time to first frame: {startup_metrics['first_frame']:.1f}s after start")
+    yield outcome["images"], True
+
+def cancel_generation():
+    """Asks the running generation to stop after the current denoising step."""
+    cancel_event.set()
+    app_logger.info("Cancellation requested")
+
+def select_frame(evt: gr.SelectData):
+    """Remembers which gallery frame the user accepted."""
+    session.selected_frame = evt.index
+
+def upscale_selected_frame():
+    """Second stage of draft mode: upscales the selected frame in place and saves the session."""
+    if session.selected_frame is None:
+        return gr.update(), "Сначала выберите кадр в галерее"
+    index = session.gallery_offset + session.selected_frame
+    if index >= len(session.images):
+        return gr.update(), "Кадр не найден"
+    cancel_event.clear()
+
+    generator = models.get("generator")
+    frame = session.frames[index] if index < len(session.frames) else {}
+    upscaled = generator.upscale(frame, image=session.images[index], educational_mode=session.educational_mode, scheduler=session.scheduler, cancel_event=cancel_event)
+    if upscaled is None:
+        return gr.update(), "Увеличение остановлено"
+    session.images[index] = upscaled
+    if index < len(session.frames) and generator.last_frames:
+        session.frames[index] = generator.last_frames[0]
+    app_logger.info(f"Frame {index} upscaled to {upscaled.width}x{upscaled.height}")
+
+    session_manager.save_session(
+        session.session_id,
+        session.history,
+        session.char_desc,
+        session.style,
+        session.current_seed,
+        session.educational_mode,
+        images=session.images,
+        generation_info=generator.last_generation_info,
+        frames=session.frames,
+        context=session.context.to_dict()
+    )
+    return session.images[session.gallery_offset:], f"Кадр {session.selected_frame + 1} увеличен до {upscaled.width}x{upscaled.height}"
+
+def start_story(character_input, style_input, educational_mode, scene_count, scheduler_input=None, profile_input=None, draft_mode_input=False):
     """Initializes the story session."""
+    cancel_event.clear()
     session.reset()
     session.char_desc = character_input
     session.style = style_input
     session.educational_mode = educational_mode
+    session.scheduler = scheduler_input
+    session.profile = profile_input
+    session.draft_mode = draft_mode_input
     
     app_logger.info(f"Starting new session: {session.session_id}")
     app_logger.info(f"Character: {character_input}, Style: {style_input}, Educational: {educational_mode}, Scenes: {scene_count}")
     
+    # Requests that arrive during warm-up wait for the models instead of failing
+    if not models.is_ready():
+        yield [{"role": "assistant", "content": MODELS_LOADING_MESSAGE}], []
+    
     # Smart Detection: Is this a Story or a Topic?
     is_narrative = len(character_input) > 50 and character_input.count(' ') > 5
     
     if is_narrative:
         # Narrative Mode: Visualize the user's text directly!
         intro_text = character_input
-        session.history = f"Система: Визуализация сюжета.\nСюжет: {character_input}"
+        session.context = StoryContext(f"Система: Визуализация сюжета. Стиль: {style_input}.")
+        session.context.add_turn("Сюжет", character_input)
         # We don't ask the LLM to generate text, we just say "Here is your visualization"
         chat_output = "Генерирую визуальный ряд по вашему сюжету..."
         
@@ -150,18 +350,32 @@ def start_story(character_input, style_input, educational_mode, scene_count):
         # Topic Mode: Generate educational intro
         if educational_mode:
             intro_prompt = f"Тема занятия: {character_input}. Стиль изложения: {style_input}. Введение:"
-            intro_text = storyteller.generate_response("Лекция началась.", intro_prompt, educational_mode=True)
-            session.history = f"Система: Занятие на тему '{character_input}'.\nЛектор: {intro_text}"
+            intro_text = models.get("storyteller").generate_response("Лекция началась.", intro_prompt, educational_mode=True)
+            session.context = StoryContext(f"Система: Занятие на тему '{character_input}'. Стиль изложения: {style_input}.")
+            session.context.add_turn("Лектор", intro_text)
         else:
             intro_prompt = f"История начинается. Главный герой: {character_input}. Жанр: {style_input}. Начало:"
-            intro_text = storyteller.generate_response("Вступление:", intro_prompt, educational_mode=False)
-            session.history = f"Система: История о {character_input}.\nМастер: {intro_text}"
+            intro_text = models.get("storyteller").generate_response("Вступление:", intro_prompt, educational_mode=False)
+            session.context = StoryContext(f"Система: История о {character_input}. Жанр: {style_input}.")
+            session.context.add_turn("Мастер", intro_text)
         chat_output = intro_text
     
-    # Generate Sequence
+    # Return format: List of [User, Bot] dicts
+    chat_history = [
+        {"role": "assistant", "content": chat_output}
+    ]
+    yield chat_history, []
+    
+    # Generate Sequence, streaming previews into the gallery while frames denoise
     # IMPORTANT: If narrative, intro_text IS the narrative. If topic, intro_text IS the generated lecture.
-    imgs = generate_sequence(intro_text, character_input, style_input, count=scene_count, educational_mode=educational_mode)
+    new_frames = []
+    for imgs, finished in stream_sequence(intro_text, character_input, style_input, count=scene_count, educational_mode=educational_mode, scheduler=session.scheduler, cancel_event=cancel_event, profile=session.profile, frames_out=new_frames, draft=session.draft_mode):
+        if not finished:
+            yield chat_history, imgs
     session.images.extend(imgs)
+    session.frames.extend(new_frames)
+    session.gallery_offset = len(session.images) - len(imgs)
+    session.selected_frame = None
     
     # Save session
     session_manager.save_session(
@@ -171,14 +385,12 @@ def start_story(character_input, style_input, educational_mode, scene_count):
         session.style, 
         session.current_seed,
         session.educational_mode,
-        images=session.images
+        images=session.images,
+        generation_info=models.get("generator").last_generation_info,
+        frames=session.frames,
+        context=session.context.to_dict()
     )
     
-    # Return format: List of [User, Bot] dicts
-    chat_history = [
-        {"role": "assistant", "content": chat_output}
-    ]
-    
     # Save session with chat history
     session_manager.save_session(
         session.session_id, 
@@ -188,39 +400,56 @@ def start_story(character_input, style_input, educational_mode, scene_count):
         session.current_seed,
         session.educational_mode,
         images=session.images,
-        chat_history=chat_history
+        chat_history=chat_history,
+        generation_info=models.get("generator").last_generation_info,
+        frames=session.frames,
+        context=session.context.to_dict()
     )
     
-    return chat_history, imgs
+    yield chat_history, imgs
 
 def chat_turn(user_message, chat_history):
     """Handles a single turn of the chat."""
     if not user_message:
-        return chat_history, None
+        yield chat_history, gr.update()
+        return
 
     app_logger.info(f"User message: {user_message}")
+    cancel_event.clear()
+
+    # Generate Text Response (the prompt window is built from the turns before this one)
+    if not models.is_ready():
+        yield chat_history + [{"role": "assistant", "content": MODELS_LOADING_MESSAGE}], gr.update()
+
+    # The answer is streamed into the chat token by token; the gallery keeps the
+    # previous frames (and selection) until the first preview of the new ones arrives
+    chat_history.append({"role": "user", "content": user_message})
+    chat_history.append({"role": "assistant", "content": ""})
+    response_text = ""
+    for response_text in models.get("storyteller").stream_response(session.context, user_message, educational_mode=session.educational_mode, session_id=session.session_id):
+        chat_history[-1]["content"] = response_text
+        yield chat_history, gr.update()
 
     # Update history
     if session.educational_mode:
-        session.history += f"\nСтудент: {user_message}"
+        session.context.add_turn("Студент", user_message)
+        session.context.add_turn("Лектор", response_text)
     else:
-        session.history += f"\nИгрок: {user_message}"
+        session.context.add_turn("Игрок", user_message)
+        session.context.add_turn("Мастер", response_text)
     
-    # Generate Text Response
-    response_text = storyteller.generate_response(session.history, user_message, educational_mode=session.educational_mode)
+    chat_history[-1]["content"] = response_text
+    yield chat_history, gr.update()
     
-    if session.educational_mode:
-        session.history += f"\nЛектор: {response_text}"
-    else:
-        session.history += f"\nМастер: {response_text}"
-    
-    # Generate Sequence
-    imgs = generate_sequence(response_text, session.char_desc, session.style, educational_mode=session.educational_mode)
+    # Generate Sequence, streaming previews into the gallery while frames denoise
+    new_frames = []
+    for imgs, finished in stream_sequence(response_text, session.char_desc, session.style, educational_mode=session.educational_mode, scheduler=session.scheduler, cancel_event=cancel_event, profile=session.profile, frames_out=new_frames, draft=session.draft_mode):
+        if not finished:
+            yield chat_history, imgs
     session.images.extend(imgs)
-    
-    # Update chat history
-    chat_history.append({"role": "user", "content": user_message})
-    chat_history.append({"role": "assistant", "content": response_text})
+    session.frames.extend(new_frames)
+    session.gallery_offset = len(session.images) - len(imgs)
+    session.selected_frame = None
     
     # Save session
     session_manager.save_session(
@@ -231,10 +460,13 @@ def chat_turn(user_message, chat_history):
         session.current_seed,
         session.educational_mode,
         images=session.images,
-        chat_history=chat_history or [] # Pass the structured chat history
+        chat_history=chat_history or [], # Pass the structured chat history
+        generation_info=models.get("generator").last_generation_info,
+        frames=session.frames,
+        context=session.context.to_dict()
     )
     
-    return chat_history, imgs
+    yield chat_history, imgs
 
 def import_session_handler(file_obj):
     """Handles session import from a JSON file."""
@@ -248,7 +480,11 @@ def import_session_handler(file_obj):
             
         # Restore session state
         session.session_id = data.get("session_id", str(uuid.uuid4()))
-        session.history = data.get("history", "")
+        # Sessions saved before turns were stored only have the plain-text history
+        if data.get("context"):
+            session.context = StoryContext.from_dict(data["context"])
+        else:
+            session.context = StoryContext.from_text(data.get("history", ""))
         session.char_desc = data.get("character", "")
         session.style = data.get("style", "")
         session.current_seed = data.get("seed", -1)
@@ -264,19 +500,32 @@ def import_session_handler(file_obj):
         
         # Restore images (paths might be relative or need checking)
         saved_images = data.get("saved_images", [])
-        session.images = [] # We can't easily load PIL images from paths without reopening them
+        # Sessions saved before latents were stored have no saved_latents/frames
+        saved_latents = data.get("saved_latents", [])
+        saved_frames = data.get("frames", [])
+        session.images = []
+        session.frames = []
+        session.gallery_offset = 0
+        session.selected_frame = None
         
-        # Try to reload images for the gallery
+        # Try to reload images for the gallery, together with their latents
         gallery_images = []
-        for img_path in saved_images:
-            if os.path.exists(img_path):
-                 gallery_images.append(img_path)
-            else:
+        base_dir = os.path.dirname(file_obj.name)
+        for idx, img_path in enumerate(saved_images):
+            if not os.path.exists(img_path):
                  # Try relative to the json file if absolute fail
-                 base_dir = os.path.dirname(file_obj.name)
-                 rel_path = os.path.join(base_dir, os.path.basename(img_path))
-                 if os.path.exists(rel_path):
-                     gallery_images.append(rel_path)
+                 img_path = os.path.join(base_dir, os.path.basename(img_path))
+                 if not os.path.exists(img_path):
+                     continue
+            gallery_images.append(img_path)
+            session.images.append(Image.open(img_path).convert("RGB"))
+
+            latent_path = saved_latents[idx] if idx < len(saved_latents) else None
+            if latent_path and not os.path.exists(latent_path):
+                latent_path = os.path.join(base_dir, os.path.basename(latent_path))
+            frame = dict(saved_frames[idx]) if idx < len(saved_frames) else {}
+            frame["latents"] = session_manager.load_latents(latent_path)
+            session.frames.append(frame)
 
         app_logger.info(f"Session imported: {session.session_id}")
         return restored_chat, gallery_images, f"Сессия загружена: {session.char_desc}"
@@ -294,6 +543,7 @@ with gr.Blocks(title="Neuro Tale: Генератор образовательн
     gr.Markdown("- Реляционным базам данных")
     gr.Markdown("- Веб-разработке")
     gr.Markdown("- Разработке интерфейсов")
+    gr.Markdown(models_status_markdown, every=2)
     
     with gr.Row():
         with gr.Column(scale=1):
@@ -315,8 +565,26 @@ with gr.Blocks(title="Neuro Tale: Генератор образовательн
             )
             scene_count_slider = gr.Slider(label="Количество сцен", minimum=1, maximum=5, value=3, step=1)
             low_memory_checkbox = gr.Checkbox(label="Режим 8GB RAM (низкое качество)", value=False)
+            scheduler_dropdown = gr.Dropdown(
+                label="Сэмплер",
+                choices=[(spec["label"], name) for name, spec in SCHEDULERS.items()],
+                value=config.get("generation.scheduler", "dpmpp_2m"),
+                info="Число шагов подбирается под выбранный сэмплер"
+            )
+            profile_dropdown = gr.Dropdown(
+                label="Профиль скорость/качество",
+                choices=[(spec["label"], name) for name, spec in SPEED_PROFILES.items()],
+                value=config.get("generation.profile", "quality"),
+                info="Быстрые профили отключают CFG на последних шагах"
+            )
+            draft_mode_checkbox = gr.Checkbox(
+                label="Черновики + увеличение",
+                value=False,
+                info="Быстрые черновики; выбранный в галерее кадр увеличивается кнопкой ниже"
+            )
             
             start_btn = gr.Button("🚀 Создать последовательность", variant="primary")
+            stop_btn = gr.Button("⏹ Остановить генерацию", variant="stop")
             
             # Import Section
             gr.Markdown("---")
@@ -331,6 +599,8 @@ with gr.Blocks(title="Neuro Tale: Генератор образовательн
                 object_fit="contain", 
                 height="auto"
             )
+            upscale_btn = gr.Button("🔍 Увеличить выбранный кадр")
+            upscale_status = gr.Textbox(label="Статус увеличения", interactive=False)
             
         with gr.Column(scale=2):
             # Chat Interface
@@ -345,10 +615,13 @@ with gr.Blocks(title="Neuro Tale: Генератор образовательн
     # Events
     start_btn.click(
         fn=start_story,
-        inputs=[char_input, style_input, educational_checkbox, scene_count_slider],
+        inputs=[char_input, style_input, educational_checkbox, scene_count_slider, scheduler_dropdown, profile_dropdown, draft_mode_checkbox],
         outputs=[chatbot, scene_gallery]
     )
     
+    # Runs outside the queue so it is handled while a generation occupies the worker
+    stop_btn.click(fn=cancel_generation, inputs=None, outputs=None, queue=False)
+    
     send_btn.click(
         fn=chat_turn,
         inputs=[msg_input, chatbot],
@@ -360,6 +633,13 @@ with gr.Blocks(title="Neuro Tale: Генератор образовательн
         outputs=[chatbot, scene_gallery]
     )
     
+    scene_gallery.select(fn=select_frame, inputs=None, outputs=None)
+    upscale_btn.click(
+        fn=upscale_selected_frame,
+        inputs=None,
+        outputs=[scene_gallery, upscale_status]
+    )
+    
     import_file.change(
         fn=import_session_handler,
         inputs=[import_file],
@@ -367,4 +647,7 @@ with gr.Blocks(title="Neuro Tale: Генератор образовательн
     )
 
 if __name__ == "__main__":
-    demo.launch(share=True)
+    demo.launch(share=True, prevent_thread_lock=True)
+    startup_metrics["first_ui"] = time.perf_counter() - APP_START
+    app_logger.info(f"Time to first UI: {startup_metrics['first_ui']:.1f}s after start")
+    demo.block_thread()
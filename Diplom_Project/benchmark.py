@@ -0,0 +1,186 @@
+"""
+Benchmark of ImageGenerator speed/quality variants.
+
+Every variant renders the same prompt with the same seed in a fresh Python process,
+so freed weights, allocator arenas and global torch settings (thread counts, dynamo
+config) of one variant can't skew the next. The script reports seconds per denoising
+step, the resident memory added by loading the model and the PSNR against the first
+variant (the baseline), so speedups and memory savings can be weighed against the
+quality they cost.
+
+Usage:
+    python benchmark.py --variants default torch-optimized --steps 20 --size 384 --report benchmark.md
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+# Add current directory to path
+sys.path.append(os.getcwd())
+
+PROMPT = "clean flow chart diagram on white background, bubble sort algorithm, 2d vector graphics"
+NEGATIVE_PROMPT = "blurry, low quality, distorted, photorealistic, 3d"
+
+# name -> (ImageGenerator kwargs, generate kwargs)
+VARIANTS = {
+    "default": ({"cpu_backend": "default"}, {}),
+    "torch-optimized": ({"cpu_backend": "torch-optimized"}, {}),
+    "onnx": ({"backend": "onnx"}, {}),
+    "int8": ({"quantize": "int8"}, {}),
+    "cfg-cutoff-0.8": ({}, {"cfg_cutoff": 0.8}),
+    "cfg-cutoff-0.6": ({}, {"cfg_cutoff": 0.6}),
+    "deepcache-3": ({}, {"deepcache_interval": 3}),
+    "profile-fast": ({}, {"profile": "fast"}),
+}
+
+def psnr(reference, image):
+    a = np.asarray(reference, dtype=np.float64)
+    b = np.asarray(image.resize(reference.size), dtype=np.float64)
+    mse = np.mean((a - b) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        # Unix only; not available on Windows
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return float("nan")
+
+def run_variant(name, args):
+    """Runs inside the worker process; returns (image, seconds_per_step, model_mb)."""
+    from core.generator import ImageGenerator
+
+    generator_kwargs, generate_kwargs = VARIANTS[name]
+    rss_before = rss_mb()
+    generator = ImageGenerator(**generator_kwargs)
+    # Benchmarks must always denoise
+    generator.frame_cache = None
+    generator.load_model()
+    if generator.pipeline is None:
+        print(f"[{name}] model failed to load: {generator.last_error}")
+        return None, None, None
+    model_mb = rss_mb() - rss_before
+
+    timings = []
+    image = None
+    # The first run is a warm-up (lazy init, torch.compile)
+    for run in range(args.runs + 1):
+        image = generator.generate(
+            PROMPT,
+            negative_prompt=NEGATIVE_PROMPT,
+            seed=args.seed,
+            height=args.size,
+            width=args.size,
+            steps=args.steps,
+            scheduler=args.scheduler,
+            **generate_kwargs
+        )
+        if run > 0 and generator.last_timing:
+            timings.append(generator.last_timing["seconds_per_step"])
+
+    seconds_per_step = sum(timings) / len(timings) if timings else None
+    return image, seconds_per_step, model_mb
+
+def worker(args):
+    """--worker mode: benchmarks one variant and writes the image and a JSON result."""
+    image, seconds_per_step, model_mb = run_variant(args.worker, args)
+    if image is not None:
+        image.save(args.image_out)
+    with open(args.result_out, "w", encoding="utf-8") as f:
+        json.dump({"ok": image is not None, "seconds_per_step": seconds_per_step, "model_mb": model_mb}, f)
+
+def spawn_variant(name, args, work_dir):
+    """Runs one variant in a fresh process; returns (image, seconds_per_step, model_mb)."""
+    image_path = os.path.join(work_dir, f"{name}.png")
+    result_path = os.path.join(work_dir, f"{name}.json")
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", name,
+        "--image-out", image_path, "--result-out", result_path,
+        "--steps", str(args.steps), "--size", str(args.size), "--seed", str(args.seed),
+        "--runs", str(args.runs), "--scheduler", args.scheduler,
+    ]
+    completed = subprocess.run(command)
+    if completed.returncode != 0 or not os.path.exists(result_path):
+        print(f"[{name}] worker failed with exit code {completed.returncode}")
+        return None, None, None
+    with open(result_path, encoding="utf-8") as f:
+        result = json.load(f)
+    if not result["ok"]:
+        return None, None, None
+    with Image.open(image_path) as img:
+        image = img.convert("RGB")
+    return image, result["seconds_per_step"], result["model_mb"]
+
+def format_table(results, args):
+    lines = [
+        f"{args.size}x{args.size}, {args.steps} steps, scheduler {args.scheduler}, {args.runs} timed run(s) per variant",
+        "",
+        "| variant | s/step | speedup | model RSS (MB) | PSNR vs baseline (dB) |",
+        "|---|---|---|---|---|",
+    ]
+    baseline = results[0][1] if results else None
+    for name, seconds_per_step, model_mb, quality in results:
+        speedup = baseline / seconds_per_step if baseline and seconds_per_step else float("nan")
+        step_text = f"{seconds_per_step:.3f}" if seconds_per_step else "n/a"
+        lines.append(f"| {name} | {step_text} | {speedup:.2f}x | {model_mb:.0f} | {quality:.2f} |")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="ImageGenerator benchmark")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--size", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--scheduler", default="dpmpp_2m")
+    parser.add_argument("--save-dir", default=None, help="Save every variant's image for visual comparison")
+    parser.add_argument("--report", default=None, help="Write the results table (Markdown) to this file")
+    # Internal: one variant per worker process
+    parser.add_argument("--worker", default=None, choices=list(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument("--image-out", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-out", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    results = []
+    reference = None
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as work_dir:
+        for name in args.variants:
+            print(f"\n=== {name} ===")
+            image, seconds_per_step, model_mb = spawn_variant(name, args, work_dir)
+            if image is None:
+                continue
+            if reference is None:
+                reference = image
+            if args.save_dir:
+                os.makedirs(args.save_dir, exist_ok=True)
+                image.save(os.path.join(args.save_dir, f"{name}.png"))
+            results.append((name, seconds_per_step, model_mb, psnr(reference, image)))
+
+    table = format_table(results, args)
+    print("\n" + table)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(table + "\n")
+        print(f"Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
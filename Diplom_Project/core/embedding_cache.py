@@ -0,0 +1,86 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import torch
+
+from utils.storage import evict_lru, mark_used
+
+class EmbeddingCache:
+    """
+    LRU cache of text-encoder outputs keyed by (model_id, prompt text).
+    Entries can optionally be persisted to disk so they survive restarts; the disk
+    store is kept under max_bytes by evicting the least recently used files.
+    """
+
+    def __init__(self, max_entries=64, cache_dir=None, max_bytes=128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def get(self, model_id, text, encode_fn):
+        """Returns the embedding for text, calling encode_fn(text) only on a miss."""
+        key = (model_id, text)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        embedding = self._load(key)
+        if embedding is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            embedding = encode_fn(text)
+            self._save(key, embedding)
+
+        self.entries[key] = embedding
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return embedding
+
+    def stats(self):
+        """Returns hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries)
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+    def _path(self, key):
+        digest = hashlib.sha256("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pt")
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            embedding = torch.load(path, map_location="cpu")
+            mark_used(path)
+            return embedding
+        except Exception as e:
+            print(f"Failed to load cached embedding {path}: {e}")
+            return None
+
+    def _save(self, key, embedding):
+        if not self.cache_dir:
+            return
+        try:
+            torch.save(embedding.detach().cpu(), self._path(key))
+        except Exception as e:
+            print(f"Failed to save embedding to cache: {e}")
+            return
+        evict_lru(self.cache_dir, (".pt",), self.max_bytes)
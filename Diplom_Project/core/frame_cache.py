@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from utils.storage import evict_lru, mark_used
+
+class FrameCache:
+    """
+    Content-addressed on-disk store of generated frames.
+    Frames are keyed by a hash of every parameter that affects the output and the
+    directory is kept under max_bytes by evicting the least recently used files.
+    A frame's final latents, when known, are stored next to its PNG.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @staticmethod
+    def make_key(**params):
+        """Hashes generation parameters into a stable cache key."""
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached frame for key or None."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with Image.open(path) as img:
+                image = img.convert("RGB")
+            mark_used(path)
+            self.hits += 1
+            return image
+        except Exception as e:
+            print(f"Failed to read cached frame {path}: {e}")
+            self.misses += 1
+            return None
+
+    def has(self, key):
+        """Cheap existence check; doesn't read the frame, touch it or count a hit/miss."""
+        return os.path.exists(self._path(key))
+
+    def get_latents(self, key):
+        """Returns the cached fp16 latents for key or None."""
+        path = self._latents_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                latents = data["latents"]
+            mark_used(path)
+            return latents
+        except Exception as e:
+            print(f"Failed to read cached latents {path}: {e}")
+            return None
+
+    def put(self, key, image, latents=None):
+        """Stores a frame (and its latents) and evicts old ones if the cache grew over its size limit."""
+        try:
+            image.save(self._path(key), format="PNG")
+            if latents is not None:
+                np.savez_compressed(self._latents_path(key), latents=np.asarray(latents, dtype=np.float16))
+        except Exception as e:
+            print(f"Failed to cache frame: {e}")
+            return
+        evict_lru(self.cache_dir, (".png", ".npz"), self.max_bytes)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _latents_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
@@ -1,23 +1,128 @@
 import torch
-from diffusers import StableDiffusionPipeline
+from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionPipeline
 from PIL import Image, ImageDraw
+import contextlib
+import gc
 import hashlib
+import inspect
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core.embedding_cache import EmbeddingCache
+from core.frame_cache import FrameCache
+from core.onnx_backend import load_onnx_pipeline
+from core.previews import PreviewDecoder
+from core.profiles import get_profile
+from core.quantization import quantize_components
+from core.schedulers import SCHEDULERS, build_scheduler, get_available_schedulers
+from utils.config import config
+
+class GenerationCancelled(Exception):
+    """Raised from the step callback to stop denoising between steps."""
 
 class ImageGenerator:
-    def __init__(self, device=None, low_memory_mode=False):
+    # Rough activation budget per UNet call, in pixels summed over the batch.
+    # Low memory mode fits two 384x384 frames, the normal mode four 512x512 frames.
+    BATCH_PIXEL_BUDGET = {True: 2 * 384 * 384, False: 4 * 512 * 512}
+
+    EDUCATIONAL_NEGATIVE_PROMPT = (
+        "blurry, low quality, deformed, ugly, bad anatomy, extra limbs, poorly drawn face, bad proportions, "
+        "extra fingers, fused fingers, malformed hands, watermark, text, signature, logo, username, "
+        "cartoon, anime, 3d render, painting, sketch, lowres, jpeg artifacts, noise, grain, overexposed, "
+        "underexposed, bad lighting, chromatic aberration, lens flare, unrealistic, fantasy, surreal, "
+        "colorful background, abstract art, artistic, decorative"
+    )
+
+    CPU_BACKENDS = ("default", "torch-optimized")
+    BACKENDS = ("diffusers", "onnx")
+
+    def __init__(self, device=None, low_memory_mode=False, cpu_backend=None, backend=None, quantize=None):
         self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
         self.low_memory_mode = low_memory_mode
-        print(f"Using device: {self.device}, Low memory mode: {low_memory_mode}")
+        self.cpu_backend = cpu_backend or config.get("generation.cpu_backend", "default")
+        if self.cpu_backend not in self.CPU_BACKENDS:
+            print(f"Unknown CPU backend '{self.cpu_backend}', using default")
+            self.cpu_backend = "default"
+        self.backend = backend or config.get("model.backend", "diffusers")
+        if self.backend not in self.BACKENDS:
+            print(f"Unknown backend '{self.backend}', using diffusers")
+            self.backend = "diffusers"
+        if self.backend == "onnx":
+            # The ONNX backend runs on onnxruntime's CPU execution provider
+            self.device = "cpu"
+        # int8 dynamic quantization is a CPU-only mode of the diffusers backend
+        self.quantize = quantize if quantize is not None else config.get("generation.cpu_quantization")
+        if self.quantize and (self.device != "cpu" or self.backend != "diffusers"):
+            print("int8 quantization is only available for the diffusers backend on CPU")
+            self.quantize = None
+        print(f"Using device: {self.device}, Low memory mode: {low_memory_mode}, Backend: {self.backend}, CPU backend: {self.cpu_backend}, Quantization: {self.quantize}")
         self.pipeline = None
+        # img2img view of the loaded pipeline for continuation frames, built on first use
+        self._img2img_pipeline = None
+        self.use_bf16 = False
+        # torch-optimized backend: s/step before and after the optimizations (measured at load)
+        self.cpu_optimization_timing = None
+        self.last_timing = None
+        # Settings of the last generate_batch call, saved with the session metadata
+        self.last_generation_info = None
+        # One record per returned frame of the last call: prompt, negative_prompt, seed and
+        # final latents (fp16 numpy array, None where unknown). Sessions store them so that
+        # refine()/upscale() can resume from a frame later.
+        self.last_frames = []
         # Use the official v1-5 repo which is more reliable
         self.model_id = "stable-diffusion-v1-5/stable-diffusion-v1-5"
         self.last_error = None
 
+        # Scheduler selection; swapping schedulers reuses the loaded pipeline
+        self.scheduler_name = config.get("generation.scheduler", "dpmpp_2m")
+        self.lcm_lora = config.get("model.lcm_lora")
+        self.lcm_available = "lcm" in self.model_id.lower()
+        self._base_scheduler = None
+        self._schedulers = {}
+
+        # Speed/quality profile (CFG truncation, DeepCache etc.)
+        self.profile = config.get("generation.profile", "quality")
+        # DeepCache helper, created on first use (optional dependency)
+        self._deepcache_helper = None
+        self.deepcache_available = True
+
+        # Live previews of frames that are still denoising
+        self.preview_every = config.get("generation.preview_every", 5)
+        self.preview_decoder = PreviewDecoder(config.get("generation.preview_decoder", "linear"), device=self.device)
+
+        # Text-encoder outputs are reused across frames and calls
+        embedding_dir = None
+        if config.get("cache.embedding_disk", True):
+            embedding_dir = os.path.join(config.get("paths.cache_dir", "cache"), "embeddings")
+        self.embedding_cache = EmbeddingCache(
+            max_entries=config.get("cache.embedding_max_entries", 64),
+            cache_dir=embedding_dir,
+            max_bytes=config.get("cache.embedding_disk_max_mb", 128) * 1024 * 1024
+        )
+
+        # VAE decoding and PIL post-processing run on a worker thread so the next
+        # frame's UNet loop can start while the previous frame is decoded
+        self.pipelined_decode = config.get("generation.pipelined_decode", True)
+        # Set when model/sequential CPU offload is active: its hooks move modules between
+        # devices per forward, which is unsafe with the VAE running on another thread
+        self.cpu_offload = False
+        self._decode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vae-decode")
+
+        # Deterministic jobs (fixed seed, same prompt) return a stored PNG instead of re-denoising
+        self.frame_cache = FrameCache(
+            os.path.join(config.get("paths.output_dir", "outputs"), "frame_cache"),
+            max_bytes=config.get("cache.frame_max_mb", 512) * 1024 * 1024
+        )
+
     def load_model(self):
         """Loads the Stable Diffusion model."""
         if self.pipeline is not None:
             return
 
+        if self.backend == "onnx" and self._load_onnx_model():
+            return
+
         print(f"Loading Stable Diffusion model ({self.model_id})...")
         try:
             # Memory optimizations
@@ -39,6 +144,9 @@ class ImageGenerator:
                 use_safetensors=True,
                 **pipeline_kwargs
             )
+            if self.quantize:
+                # fp32 modules are quantized to get the int8 layout; cached int8 weights are loaded into it
+                quantize_components(self.pipeline, self.model_id, config.get("paths.cache_dir", "cache"))
 
             if self.device == "cuda":
                 self.pipeline.enable_attention_slicing()
@@ -46,18 +154,23 @@ class ImageGenerator:
                     # Enable model CPU offloading for CUDA with low memory
                     try:
                         self.pipeline.enable_model_cpu_offload()
+                        self.cpu_offload = True
                         print("Model CPU offloading enabled")
                     except Exception as e:
                         print(f"CPU offloading failed: {e}")
                 else:
                     self.pipeline.to(self.device)
+            elif self.cpu_backend == "torch-optimized":
+                # Applied below, after LoRA loading, because the UNet gets compiled
+                pass
             else:
                 # CPU optimizations
                 self.pipeline.enable_attention_slicing()
-                if self.low_memory_mode:
+                if self.low_memory_mode and not self.quantize:
                     # Enable sequential CPU offload for very low memory
                     try:
                         self.pipeline.enable_sequential_cpu_offload()
+                        self.cpu_offload = True
                         print("Sequential CPU offload enabled")
                     except Exception as e:
                         print(f"Sequential CPU offload failed: {e}")
@@ -65,6 +178,21 @@ class ImageGenerator:
                     # Standard CPU loading
                     pass
                 
+            self._base_scheduler = self.pipeline.scheduler
+            self._schedulers = {}
+            if self.lcm_lora and self.quantize:
+                print("LCM LoRA can't be applied to int8 layers, skipping it")
+            elif self.lcm_lora:
+                try:
+                    self.pipeline.load_lora_weights(self.lcm_lora, adapter_name="lcm")
+                    self.lcm_available = True
+                    print(f"LCM LoRA loaded: {self.lcm_lora}")
+                except Exception as e:
+                    print(f"Failed to load LCM LoRA: {e}")
+            if self.device == "cpu" and self.cpu_backend == "torch-optimized":
+                self._apply_cpu_optimizations()
+            self.set_scheduler(self.scheduler_name)
+
             print("Model loaded successfully.")
             self.last_error = None
         except Exception as e:
@@ -73,13 +201,215 @@ class ImageGenerator:
             self.last_error = error_msg
             self.pipeline = None
 
-    def generate(self, prompt, negative_prompt="", seed=None, height=512, width=512, steps=30, educational_mode=False):
-        """Generates an image from a prompt."""
+    def _load_onnx_model(self):
+        """Loads the ONNX Runtime pipeline, falling back to diffusers if export or loading fails."""
+        try:
+            self.pipeline = load_onnx_pipeline(self.model_id, config.get("paths.cache_dir", "cache"))
+            self._base_scheduler = self.pipeline.scheduler
+            self._schedulers = {}
+            self.set_scheduler(self.scheduler_name)
+            # One tiny run, so an incompatible optimum/onnxruntime API falls back to
+            # diffusers here instead of turning every frame into a placeholder
+            self._run_onnx_pipeline(["warm-up"], [""], 128, 128, 1, [torch.Generator().manual_seed(0)], 7.5)
+            print("ONNX Runtime model loaded successfully.")
+            self.last_error = None
+            return True
+        except Exception as e:
+            print(f"ONNX backend unavailable, falling back to diffusers: {e}")
+            self.pipeline = None
+            self.backend = "diffusers"
+            return False
+
+    def _apply_cpu_optimizations(self):
+        """
+        torch-optimized CPU backend: explicit thread tuning, SDPA attention instead of
+        slicing, channels_last tensors, bfloat16 autocast where the CPU has native support
+        and a torch.compile'd UNet whose compiled graphs are cached on disk across restarts.
+        """
+        threads = config.get("generation.cpu_threads") or max(1, (os.cpu_count() or 2) // 2)
+        torch.set_num_threads(threads)
+        try:
+            # Only allowed before any inter-op work has started
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+        print(f"CPU threads: {torch.get_num_threads()} intra-op")
+
+        # s/step of the plain fp32 UNet, reported next to the optimized one below
+        try:
+            eager_seconds = self._time_unet_step()
+        except Exception as e:
+            print(f"UNet timing failed: {e}")
+            eager_seconds = None
+
+        try:
+            from diffusers.models.attention_processor import AttnProcessor2_0
+            self.pipeline.unet.set_attn_processor(AttnProcessor2_0())
+            self.pipeline.vae.set_attn_processor(AttnProcessor2_0())
+        except Exception as e:
+            print(f"SDPA attention unavailable: {e}")
+
+        self.pipeline.unet.to(memory_format=torch.channels_last)
+        self.pipeline.vae.to(memory_format=torch.channels_last)
+
+        # Dynamically quantized Linear layers take fp32 activations
+        self.use_bf16 = self._cpu_supports_bf16() and not self.quantize
+        print(f"bfloat16 autocast: {self.use_bf16}")
+
+        if config.get("generation.cpu_compile", True):
+            try:
+                inductor_dir = os.path.abspath(os.path.join(config.get("paths.cache_dir", "cache"), "inductor"))
+                os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", inductor_dir)
+                import torch._inductor.config as inductor_config
+                inductor_config.fx_graph_cache = True
+                self.pipeline.unet = torch.compile(self.pipeline.unet)
+                # Compilation is lazy: run one forward here so that a missing C++ toolchain
+                # or an unsupported op fails now rather than on every frame
+                self._time_unet_step()
+                # Recompiles for other resolutions fall back to eager instead of failing
+                import torch._dynamo
+                torch._dynamo.config.suppress_errors = True
+                print(f"UNet compiled, graph cache: {os.environ['TORCHINDUCTOR_CACHE_DIR']}")
+            except Exception as e:
+                self.pipeline.unet = getattr(self.pipeline.unet, "_orig_mod", self.pipeline.unet)
+                print(f"torch.compile failed, running eager: {e}")
+
+        try:
+            optimized_seconds = self._time_unet_step()
+        except Exception as e:
+            print(f"UNet timing failed: {e}")
+            optimized_seconds = None
+        self.cpu_optimization_timing = {"default_seconds_per_step": eager_seconds, "optimized_seconds_per_step": optimized_seconds}
+        if eager_seconds and optimized_seconds:
+            print(f"UNet step: {eager_seconds:.2f} s/step fp32 eager -> {optimized_seconds:.2f} s/step torch-optimized "
+                  f"({eager_seconds / optimized_seconds:.2f}x)")
+
+    def _time_unet_step(self):
+        """Runs one UNet forward with a CFG batch at the default resolution; returns its seconds."""
+        unet = self.pipeline.unet
+        size = config.get("generation.default_height", 512)
+        if self.low_memory_mode:
+            size = min(size, 384)
+        sample = torch.randn(2, unet.config.in_channels, size // 8, size // 8)
+        hidden_states = torch.randn(2, self.pipeline.tokenizer.model_max_length, unet.config.cross_attention_dim)
+        timestep = torch.tensor(999)
+        started = time.perf_counter()
+        with torch.no_grad(), self._autocast():
+            unet(sample.to(memory_format=torch.channels_last), timestep, encoder_hidden_states=hidden_states)
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _cpu_supports_bf16():
+        try:
+            return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+        except Exception:
+            return False
+
+    def _autocast(self):
+        """Mixed precision context for the current device and backend."""
+        if self.device == "cuda":
+            return torch.autocast(self.device)
+        if self.use_bf16:
+            return torch.autocast("cpu", dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def get_available_schedulers(self):
+        """Returns scheduler names that can be used with the loaded model."""
+        return get_available_schedulers(self.lcm_available)
+
+    def get_scheduler_steps(self, name):
+        """Returns the step budget tied to a scheduler."""
+        configured = config.get(f"generation.scheduler_steps.{name}")
+        if configured:
+            return configured
+        if name == "default":
+            return config.get("generation.default_steps", SCHEDULERS[name]["steps"])
+        return SCHEDULERS[name]["steps"]
+
+    def set_scheduler(self, name):
+        """
+        Switches the pipeline scheduler in place, without reloading the model.
+        Returns the name of the scheduler that is actually active.
+        """
+        if name not in SCHEDULERS:
+            print(f"Unknown scheduler '{name}', using default")
+            name = "default"
+        if SCHEDULERS[name].get("requires_lcm") and not self.lcm_available:
+            print("LCM scheduler needs an LCM checkpoint or LoRA, using dpmpp_2m")
+            name = "dpmpp_2m"
+        if self.pipeline is None:
+            self.scheduler_name = name
+            return name
+
+        if name not in self._schedulers:
+            scheduler = build_scheduler(name, self._base_scheduler.config)
+            self._schedulers[name] = scheduler if scheduler is not None else self._base_scheduler
+        self.pipeline.scheduler = self._schedulers[name]
+
+        # The LCM LoRA only makes sense together with the LCM scheduler
+        if self.lcm_lora and self.lcm_available:
+            try:
+                if name == "lcm":
+                    self.pipeline.enable_lora()
+                else:
+                    self.pipeline.disable_lora()
+            except Exception as e:
+                print(f"Failed to toggle LCM LoRA: {e}")
+        return name
+
+    def generate(self, prompt, negative_prompt="", seed=None, height=512, width=512, steps=None, educational_mode=False, scheduler=None, on_preview=None, cancel_event=None, profile=None, cfg_cutoff=None, cfg_threshold=None, deepcache_interval=None):
+        """Generates an image from a prompt. Returns None if the generation was cancelled."""
+        images = self.generate_batch(
+            [prompt],
+            [negative_prompt],
+            [seed],
+            height=height,
+            width=width,
+            steps=steps,
+            educational_mode=educational_mode,
+            scheduler=scheduler,
+            on_preview=on_preview,
+            cancel_event=cancel_event,
+            profile=profile,
+            cfg_cutoff=cfg_cutoff,
+            cfg_threshold=cfg_threshold,
+            deepcache_interval=deepcache_interval
+        )
+        return images[0] if images else None
+
+    def generate_batch(self, prompts, negative_prompts=None, seeds=None, height=512, width=512, steps=None, educational_mode=False, scheduler=None, on_preview=None, cancel_event=None, profile=None, cfg_cutoff=None, cfg_threshold=None, deepcache_interval=None, continuation_strength=None):
+        """
+        Generates one image per prompt, running several frames through a single batched
+        denoising loop. Every frame gets its own torch.Generator, so a frame rendered
+        with a given seed matches the same frame rendered on its own.
+
+        on_preview(indices, images, step, total_steps) is called every preview_every steps
+        with cheap previews of the frames being denoised, and once more with the finished frames.
+
+        Setting cancel_event (a threading.Event) interrupts denoising at the next step;
+        the remaining frames are dropped and only the finished frames are returned, in order.
+
+        cfg_cutoff / cfg_threshold stop classifier-free guidance after a fraction of the
+        steps or once guidance stops changing the prediction; later steps run only the
+        conditional UNet branch. deepcache_interval=k runs the full UNet only every k steps
+        and reuses the cached deep features in between. Unset values come from the speed profile.
+
+        continuation_strength turns on continuation mode: the first frame is rendered from
+        noise, every later frame with img2img from the previous frame's latents, so only
+        continuation_strength * steps denoising steps run for it. Frames are then rendered
+        one at a time, and the frame cache serves the sequence only as a whole.
+        """
+        count = len(prompts)
+        negative_prompts = list(negative_prompts) if negative_prompts else [""] * count
+        seeds = list(seeds) if seeds else [None] * count
+
         if self.pipeline is None:
             # Try loading again if it wasn't loaded
             self.load_model()
             if self.pipeline is None:
-                return self.create_dummy_image(prompt)
+                images = [self.create_dummy_image(prompt) for prompt in prompts]
+                self._record_frames(images, prompts, negative_prompts, seeds, [None] * count)
+                return images
 
         # Adjust resolution for low memory mode
         if self.low_memory_mode:
@@ -88,60 +418,658 @@ class ImageGenerator:
             print(f"Low memory mode: using {width}x{height} resolution")
 
         # Default strong negative prompt for educational mode
-        if educational_mode and not negative_prompt:
-            negative_prompt = (
-                "blurry, low quality, deformed, ugly, bad anatomy, extra limbs, poorly drawn face, bad proportions, "
-                "extra fingers, fused fingers, malformed hands, watermark, text, signature, logo, username, "
-                "cartoon, anime, 3d render, painting, sketch, lowres, jpeg artifacts, noise, grain, overexposed, "
-                "underexposed, bad lighting, chromatic aberration, lens flare, unrealistic, fantasy, surreal, "
-                "colorful background, abstract art, artistic, decorative"
-            )
+        negative_prompts = [
+            self.EDUCATIONAL_NEGATIVE_PROMPT if educational_mode and not negative_prompt else negative_prompt
+            for negative_prompt in negative_prompts
+        ]
 
         # If seed is provided, we use it for consistency.
         # If seed is -1 or None, we randomize.
-        if seed is None or seed == -1:
-            seed = torch.randint(0, 1000000, (1,)).item()
-        
-        print(f"Generating with seed: {seed}")
-        generator = torch.Generator(device=self.device).manual_seed(seed)
+        seeds = [
+            torch.randint(0, 1000000, (1,)).item() if seed is None or seed == -1 else seed
+            for seed in seeds
+        ]
 
-        try:
-            # Adjust steps and guidance for educational mode
-            # Adjust steps and guidance for educational mode
-            if educational_mode:
-                actual_steps = 35 if self.device == "cuda" else 25 # Increased steps
-                guidance_scale = 9.0
+        # Step count follows the scheduler, guidance follows the mode
+        scheduler_name = self.set_scheduler(scheduler or self.scheduler_name)
+        actual_steps = steps or self.get_scheduler_steps(scheduler_name)
+        guidance_scale = 9.0 if educational_mode else 8.0
+        guidance_scale = SCHEDULERS[scheduler_name].get("guidance_scale", guidance_scale)
+        print(f"Scheduler: {scheduler_name}, steps: {actual_steps}, guidance: {guidance_scale}")
+
+        speed_profile = get_profile(profile or self.profile)
+        cfg_cutoff = cfg_cutoff if cfg_cutoff is not None else speed_profile["cfg_cutoff"]
+        cfg_threshold = cfg_threshold if cfg_threshold is not None else speed_profile["cfg_threshold"]
+        deepcache_interval = deepcache_interval if deepcache_interval is not None else speed_profile.get("deepcache_interval")
+        if self.backend != "diffusers":
+            # The ONNX pipeline's legacy callback can't change the guidance mid-run,
+            # and its UNet is a single ONNX graph without reusable blocks
+            cfg_cutoff = cfg_threshold = deepcache_interval = None
+        if deepcache_interval is not None and deepcache_interval <= 1:
+            deepcache_interval = None
+        if deepcache_interval and self._get_deepcache_helper() is None:
+            # Record (and key frames by) the interval that is actually applied
+            deepcache_interval = None
+        continuation = bool(continuation_strength) and count > 1
+        if continuation and self.backend != "diffusers":
+            print("Continuation mode needs the diffusers backend, rendering every frame from noise")
+            continuation = False
+        if not continuation:
+            continuation_strength = None
+
+        self.last_generation_info = {
+            "model_id": self.model_id,
+            "backend": self.backend,
+            "quantize": self.quantize,
+            "scheduler": scheduler_name,
+            "steps": actual_steps,
+            "guidance_scale": guidance_scale,
+            "width": width,
+            "height": height,
+            "profile": profile or self.profile,
+            "cfg_cutoff": cfg_cutoff,
+            "cfg_threshold": cfg_threshold,
+            "deepcache_interval": deepcache_interval,
+            "continuation_strength": continuation_strength,
+            "seeds": seeds
+        }
+
+        # Serve identical jobs from the frame cache and render each distinct job only once
+        keys = []
+        for i in range(count):
+            params = dict(
+                model_id=self.model_id,
+                prompt=prompts[i],
+                negative_prompt=negative_prompts[i],
+                seed=seeds[i],
+                steps=actual_steps,
+                guidance_scale=guidance_scale,
+                width=width,
+                height=height,
+                scheduler=scheduler_name,
+                backend=self.backend,
+                cpu_backend=self.cpu_backend if self.device == "cpu" else None,
+                quantize=self.quantize,
+                cfg_cutoff=cfg_cutoff,
+                cfg_threshold=cfg_threshold,
+                deepcache_interval=deepcache_interval
+            )
+            if continuation and i > 0:
+                # A continuation frame depends on the whole chain of frames before it
+                params.update(previous=keys[-1], continuation_strength=continuation_strength)
+            keys.append(FrameCache.make_key(**params))
+        images = [None] * count
+        latents = [None] * count
+        pending = {}
+        # Continuation frames need their predecessor's latents, which the cache doesn't hold
+        use_frame_cache = self.frame_cache is not None and (
+            not continuation or all(self.frame_cache.has(key) for key in keys)
+        )
+        for i, key in enumerate(keys):
+            if key in pending:
+                pending[key].append(i)
+                continue
+            cached = self.frame_cache.get(key) if use_frame_cache else None
+            if cached is not None:
+                images[i] = self._finish_image(cached, educational_mode)
+                latents[i] = self.frame_cache.get_latents(key)
+                if on_preview:
+                    on_preview([i], [images[i]], actual_steps, actual_steps)
             else:
-                actual_steps = 40 if self.device == "cuda" else 25 # Increased steps for non-edu
-                guidance_scale = 8.0
-            
-            # autocast for mixed precision
-            if self.device == 'cuda':
-                with torch.autocast(self.device):
-                    image = self._run_pipeline(prompt, negative_prompt, height, width, actual_steps, generator, guidance_scale)
+                pending[key] = [i]
+        if self.frame_cache and len(pending) < count:
+            print(f"Frame cache: rendering {len(pending)} of {count} frames, stats: {self.frame_cache.stats()}")
+
+        # Tiled decoding caps the VAE's peak memory above 512 px
+        if self.backend == "diffusers":
+            if width > 512 or height > 512:
+                self.pipeline.vae.enable_tiling()
             else:
-                image = self._run_pipeline(prompt, negative_prompt, height, width, actual_steps, generator, guidance_scale)
-            
-            # Add frame for educational mode
-            if educational_mode:
-                image = self.add_frame(image)
-            
+                self.pipeline.vae.disable_tiling()
+        pipelined_decode = self.pipelined_decode and not self.cpu_offload
+        output_type = "latent" if (pipelined_decode or continuation) and self.backend == "diffusers" else "pil"
+
+        jobs = list(pending.items())
+        batch_size = 1 if continuation else self.get_batch_size(height, width)
+        decodes = []
+        # Continuation mode: latents of the previous frame, the starting point of the next one
+        init_latents = None
+        for start in range(0, len(jobs), batch_size):
+            if cancel_event is not None and cancel_event.is_set():
+                return self._cancelled(images, decodes, (prompts, negative_prompts, seeds, latents))
+            chunk_jobs = jobs[start:start + batch_size]
+            first_indices = [indices[0] for _, indices in chunk_jobs]
+            chunk_prompts = [prompts[i] for i in first_indices]
+            chunk_negative_prompts = [negative_prompts[i] for i in first_indices]
+            chunk_seeds = [seeds[i] for i in first_indices]
+            print(f"Generating frames {start + 1}-{start + len(chunk_jobs)} of {len(jobs)} with seeds: {chunk_seeds}")
+            generators = [torch.Generator(device=self.device).manual_seed(seed) for seed in chunk_seeds]
+            # img2img skips the first (1 - strength) of the schedule
+            run_steps = max(1, int(actual_steps * continuation_strength)) if init_latents is not None else actual_steps
+            cfg_hook = self._cfg_truncation_hook(cfg_cutoff, cfg_threshold, run_steps)
+            step_timer = self._step_timer_hook()
+            callback = self._build_step_callback([
+                step_timer,
+                self._cancel_hook(cancel_event),
+                cfg_hook,
+                self._preview_hook(first_indices, on_preview, run_steps, (width, height))
+            ])
+            denoiser = self._get_img2img_pipeline() if init_latents is not None else self.pipeline
+            guidance_watch = self._watch_guidance(cfg_hook, cfg_threshold, denoiser)
+
+            try:
+                # autocast for mixed precision
+                started = time.perf_counter()
+                with self._autocast(), self._deepcache(deepcache_interval) as deepcache:
+                    if cfg_hook is not None:
+                        cfg_hook.deepcache = deepcache
+                    chunk_output = self._run_pipeline(chunk_prompts, chunk_negative_prompts, height, width, actual_steps, generators, guidance_scale, callback, output_type, init_latents, continuation_strength)
+                self._record_timing(time.perf_counter() - started, run_steps, len(chunk_jobs), step_timer.times)
+            except GenerationCancelled:
+                return self._cancelled(images, decodes, (prompts, negative_prompts, seeds, latents))
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error during generation: {e}")
+                for (_, indices), prompt in zip(chunk_jobs, chunk_prompts):
+                    for i in indices:
+                        images[i] = self.create_dummy_image(prompt)
+                # The next continuation frame starts from noise again
+                init_latents = None
+                continue
+            finally:
+                if guidance_watch is not None:
+                    guidance_watch.remove()
+            if continuation:
+                init_latents = chunk_output
+
+            finish_args = (chunk_jobs, chunk_prompts, chunk_output, images, latents, educational_mode, on_preview, actual_steps)
+            if output_type == "latent" and pipelined_decode:
+                decodes.append(self._decode_executor.submit(self._finish_chunk, *finish_args))
+            else:
+                self._finish_chunk(*finish_args)
+
+        for decode in decodes:
+            decode.result()
+        self._record_frames(images, prompts, negative_prompts, seeds, latents)
+        return images
+
+    def refine(self, latent, prompt, negative_prompt="", seed=None, strength=0.3, scale=1.0, steps=None, educational_mode=False, scheduler=None, cancel_event=None):
+        """
+        Resumes from a frame's stored final latents instead of re-encoding its PNG:
+        optionally upscales the latents by scale, then runs low-strength img2img on them.
+        Only strength * steps denoising steps run. Returns the refined image (its record
+        goes to last_frames), or None if the refinement was cancelled.
+        """
+        negative_prompt = self.EDUCATIONAL_NEGATIVE_PROMPT if educational_mode and not negative_prompt else negative_prompt
+        if seed is None or seed == -1:
+            seed = torch.randint(0, 1000000, (1,)).item()
+        if self.pipeline is None:
+            self.load_model()
+        if self.pipeline is None or self.backend != "diffusers":
+            if self.pipeline is not None:
+                self.last_error = "Refinement needs the diffusers backend"
+                print(self.last_error)
+            image = self.create_dummy_image(prompt)
+            self._record_frames([image], [prompt], [negative_prompt], [seed], [None])
             return image
+
+        latent = torch.as_tensor(latent).float()
+        if latent.dim() == 3:
+            latent = latent.unsqueeze(0)
+        if scale != 1.0:
+            # Latent upscaling; the img2img pass below restores the detail.
+            # Sides stay multiples of 64 px so the UNet's down/up blocks line up.
+            size = [max(8, round(side * scale / 8) * 8) for side in latent.shape[-2:]]
+            latent = torch.nn.functional.interpolate(latent, size=size, mode="bicubic")
+        latent = latent.to(self.pipeline._execution_device, dtype=self.pipeline.unet.dtype)
+        height, width = latent.shape[-2] * 8, latent.shape[-1] * 8
+
+        scheduler_name = self.set_scheduler(scheduler or self.scheduler_name)
+        actual_steps = steps or self.get_scheduler_steps(scheduler_name)
+        guidance_scale = 9.0 if educational_mode else 8.0
+        guidance_scale = SCHEDULERS[scheduler_name].get("guidance_scale", guidance_scale)
+        run_steps = max(1, int(actual_steps * strength))
+        print(f"Refining {width}x{height} latents: strength {strength}, {run_steps} of {actual_steps} steps")
+
+        if width > 512 or height > 512:
+            self.pipeline.vae.enable_tiling()
+        else:
+            self.pipeline.vae.disable_tiling()
+        generator = torch.Generator(device=self.device).manual_seed(seed)
+        step_timer = self._step_timer_hook()
+        callback = self._build_step_callback([step_timer, self._cancel_hook(cancel_event)])
+        try:
+            started = time.perf_counter()
+            with self._autocast():
+                refined = self._run_pipeline([prompt], [negative_prompt], height, width, actual_steps, [generator], guidance_scale, callback, "latent", latent, strength)
+            self._record_timing(time.perf_counter() - started, run_steps, 1, step_timer.times)
+            image = self._decode_latents(refined)[0]
+        except GenerationCancelled:
+            self.last_frames = []
+            self.free_memory()
+            return None
         except Exception as e:
             self.last_error = str(e)
-            print(f"Error during generation: {e}")
-            return self.create_dummy_image(prompt)
+            print(f"Error during refinement: {e}")
+            image = self.create_dummy_image(prompt)
+            self._record_frames([image], [prompt], [negative_prompt], [seed], [None])
+            return image
+        image = self._finish_image(image, educational_mode)
+        self._record_frames([image], [prompt], [negative_prompt], [seed], [self._latents_to_numpy(refined[0])])
+        return image
+
+    def upscale(self, frame, image=None, size=None, strength=None, steps=None, educational_mode=False, scheduler=None, cancel_event=None):
+        """
+        Second stage of draft mode: upscales an accepted draft to size px on its long side.
+        frame is a last_frames record; its stored latents are upscaled in latent space and
+        refined with low-strength img2img. Without latents the draft image is encoded first.
+        The VAE decodes in tiles. The UNet pass is not tiled, so in low memory mode the
+        target is capped to what fits BATCH_PIXEL_BUDGET as a single frame, and attention
+        runs one slice at a time.
+        """
+        size = size or config.get("generation.upscale_size", 768)
+        if self.low_memory_mode:
+            max_size = int(math.sqrt(self.BATCH_PIXEL_BUDGET[True])) // 64 * 64
+            if size > max_size:
+                print(f"Low memory mode: upscaling to {max_size}px instead of {size}px")
+                size = max_size
+        strength = strength or config.get("generation.upscale_strength", 0.35)
+        latent = frame.get("latents")
+        if latent is None:
+            if image is None or self.pipeline is None or self.backend != "diffusers":
+                self.last_error = "Upscaling needs the frame's latents or its image"
+                print(self.last_error)
+                return self.create_dummy_image(frame.get("prompt", ""))
+            latent = self.encode_image(image)
+        scale = size / (max(latent.shape[-2:]) * 8)
+        print(f"Upscaling draft to {size}px (x{scale:.2f})")
+        with self._max_attention_slicing(self.low_memory_mode):
+            return self.refine(
+                latent,
+                frame.get("prompt", ""),
+                negative_prompt=frame.get("negative_prompt", ""),
+                seed=frame.get("seed"),
+                strength=strength,
+                scale=scale,
+                steps=steps,
+                educational_mode=educational_mode,
+                scheduler=scheduler,
+                cancel_event=cancel_event
+            )
+
+    def encode_image(self, image):
+        """Encodes a PIL image into UNet latents with the VAE encoder."""
+        vae = self.pipeline.vae
+        pixels = self.pipeline.image_processor.preprocess(image.convert("RGB"))
+        pixels = pixels.to(self.pipeline._execution_device, dtype=vae.dtype)
+        with torch.no_grad():
+            latents = vae.encode(pixels).latent_dist.mode()
+        return latents * vae.config.scaling_factor
+
+    @contextlib.contextmanager
+    def _max_attention_slicing(self, enabled):
+        """Computes attention one head slice at a time; SDPA (torch-optimized) is left alone."""
+        if not enabled or self.pipeline is None or self.backend != "diffusers" or self.cpu_backend == "torch-optimized":
+            yield
+            return
+        self.pipeline.enable_attention_slicing(1)
+        try:
+            yield
+        finally:
+            self.pipeline.enable_attention_slicing()
+
+    def _finish_chunk(self, chunk_jobs, chunk_prompts, chunk_output, images, latents, educational_mode, on_preview, total_steps):
+        """Decodes a chunk's latents if needed, then caches and post-processes its frames."""
+        chunk_latents = [None] * len(chunk_jobs)
+        decoded = True
+        if torch.is_tensor(chunk_output):
+            chunk_latents = [self._latents_to_numpy(latent) for latent in chunk_output]
+            try:
+                chunk_images = self._decode_latents(chunk_output)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error during VAE decoding: {e}")
+                chunk_images = [self.create_dummy_image(prompt) for prompt in chunk_prompts]
+                decoded = False
+        else:
+            chunk_images = chunk_output
+
+        for (key, indices), image, latent in zip(chunk_jobs, chunk_images, chunk_latents):
+            # Placeholders must not be served for this job on later runs
+            if self.frame_cache and decoded:
+                self.frame_cache.put(key, image, latent)
+            for i in indices:
+                images[i] = self._finish_image(image.copy(), educational_mode)
+                latents[i] = latent
+            if on_preview:
+                on_preview(indices, [images[i] for i in indices], total_steps, total_steps)
+
+    @staticmethod
+    def _latents_to_numpy(latent):
+        """Final latents are kept as compact fp16 arrays on the CPU."""
+        return latent.detach().to("cpu", torch.float16).numpy()
+
+    def _decode_latents(self, latents):
+        """Runs the VAE decoder and converts the result to PIL images."""
+        vae = self.pipeline.vae
+        with torch.no_grad():
+            decoded = vae.decode(latents.to(vae.dtype) / vae.config.scaling_factor, return_dict=False)[0]
+        return self.pipeline.image_processor.postprocess(decoded, output_type="pil")
+
+    def _record_timing(self, seconds, steps, frames, step_times=None):
+        """
+        seconds covers the whole pipeline call. seconds_per_step is measured between the
+        step callbacks when there are at least two, so it covers only the denoising loop
+        (no text encoding or VAE decode) and is comparable across backends.
+        """
+        seconds_per_step = seconds / steps
+        if step_times and len(step_times) > 1:
+            seconds_per_step = (step_times[-1] - step_times[0]) / (len(step_times) - 1)
+        self.last_timing = {
+            "seconds": seconds,
+            "steps": steps,
+            "frames": frames,
+            "seconds_per_step": seconds_per_step
+        }
+        print(f"Denoised {frames} frame(s) in {seconds:.1f}s ({seconds_per_step:.2f} s/step)")
+
+    def _cancelled(self, images, decodes, frame_params):
+        """
+        Frees memory held by the interrupted run and returns the frames that did finish.
+        frame_params is (prompts, negative_prompts, seeds, latents) of the whole run.
+        """
+        # Frames whose denoising completed are still decoded and kept
+        for decode in decodes:
+            decode.result()
+        finished = [image for image in images if image is not None]
+        self._record_frames(images, *frame_params)
+        print(f"Generation cancelled, {len(finished)} of {len(images)} frames finished")
+        self.free_memory()
+        return finished
+
+    def _record_frames(self, images, prompts, negative_prompts, seeds, latents):
+        """Stores last_frames records for the returned (not None) images."""
+        self.last_frames = [
+            {"prompt": prompt, "negative_prompt": negative_prompt, "seed": seed, "latents": latent}
+            for image, prompt, negative_prompt, seed, latent in zip(images, prompts, negative_prompts, seeds, latents)
+            if image is not None
+        ]
+
+    def free_memory(self):
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _finish_image(self, image, educational_mode):
+        """Applies post-processing that is not part of the cached frame."""
+        # Add frame for educational mode
+        if educational_mode:
+            image = self.add_frame(image)
+        return image
+
+    def get_batch_size(self, height, width):
+        """Returns how many frames fit into one denoising loop for the current memory mode."""
+        budget = self.BATCH_PIXEL_BUDGET[self.low_memory_mode]
+        return max(1, budget // (height * width))
+
+    @contextlib.contextmanager
+    def _deepcache(self, interval):
+        """
+        DeepCache: the high-level up-block features of the UNet change slowly between
+        adjacent steps, so they are computed on every interval-th step only. The steps in
+        between run just the shallow branch (first down block, last up block) and reuse
+        the cached features. Does nothing when interval is None or DeepCache is missing.
+        Yields the enabled helper, or None.
+        """
+        helper = self._get_deepcache_helper() if interval else None
+        if helper is None:
+            yield None
+            return
+        try:
+            helper.set_params(cache_interval=interval, cache_branch_id=0)
+            helper.enable()
+        except Exception as e:
+            print(f"Failed to enable DeepCache: {e}")
+            if self.last_generation_info:
+                self.last_generation_info["deepcache_interval"] = None
+            yield None
+            return
+        print(f"DeepCache enabled, full UNet every {interval} steps")
+        try:
+            yield helper
+        finally:
+            try:
+                helper.disable()
+            except Exception as e:
+                # Already disabled by a failed _refresh_deepcache
+                print(f"Failed to disable DeepCache: {e}")
+
+    def _refresh_deepcache(self, helper):
+        """
+        Drops the cached deep features so the next step runs the full UNet. Needed when
+        the UNet batch changes mid-run (CFG truncation halves it): features cached for the
+        old batch can't be concatenated with the new skip connections.
+        """
+        try:
+            helper.disable()
+            helper.enable()
+            print("DeepCache refreshed for the new UNet batch")
+        except Exception as e:
+            # disable() already restored the plain UNet, so the run continues without DeepCache
+            print(f"Failed to refresh DeepCache, running the full UNet: {e}")
+
+    def _get_deepcache_helper(self):
+        if self._deepcache_helper is None and self.deepcache_available:
+            try:
+                # Optional dependency: DeepCache
+                from DeepCache import DeepCacheSDHelper
+                self._deepcache_helper = DeepCacheSDHelper(pipe=self.pipeline)
+            except Exception as e:
+                print(f"DeepCache unavailable, running the full UNet every step: {e}")
+                self.deepcache_available = False
+        return self._deepcache_helper
+
+    def _build_step_callback(self, hooks):
+        """
+        Chains per-step hooks into a single diffusers callback_on_step_end.
+        Each hook takes (pipe, step_index, timestep, callback_kwargs) and may return updated kwargs.
+        """
+        hooks = [hook for hook in hooks if hook]
+        if not hooks:
+            return None
+
+        def callback(pipe, step_index, timestep, callback_kwargs):
+            for hook in hooks:
+                callback_kwargs = hook(pipe, step_index, timestep, callback_kwargs) or callback_kwargs
+            return callback_kwargs
+        return callback
+
+    def _step_timer_hook(self):
+        """Returns a step hook that records when every denoising step finished (hook.times)."""
+        def hook(pipe, step_index, timestep, callback_kwargs):
+            hook.times.append(time.perf_counter())
+        hook.times = []
+        return hook
+
+    def _cancel_hook(self, cancel_event):
+        """Returns a step hook that stops denoising once cancel_event is set."""
+        if cancel_event is None:
+            return None
+
+        def hook(pipe, step_index, timestep, callback_kwargs):
+            if cancel_event.is_set():
+                raise GenerationCancelled()
+        return hook
+
+    def _cfg_truncation_hook(self, cfg_cutoff, cfg_threshold, total_steps):
+        """
+        Returns a step hook that switches classifier-free guidance off after
+        cfg_cutoff * total_steps steps, or as soon as _watch_guidance reports that the
+        guidance has converged. From then on the pipeline only runs the conditional
+        branch, halving the UNet batch. If DeepCache is active (hook.deepcache), its
+        cache is refreshed at that point.
+        """
+        if not cfg_cutoff and not cfg_threshold:
+            return None
+        cutoff_step = max(1, int(total_steps * cfg_cutoff)) if cfg_cutoff else total_steps
+
+        def hook(pipe, step_index, timestep, callback_kwargs):
+            step = step_index + 1
+            if not pipe.do_classifier_free_guidance or step >= total_steps:
+                return callback_kwargs
+            if step >= cutoff_step or hook.converged:
+                pipe._guidance_scale = 0.0
+                callback_kwargs["prompt_embeds"] = callback_kwargs["prompt_embeds"].chunk(2)[-1]
+                if hook.deepcache is not None:
+                    self._refresh_deepcache(hook.deepcache)
+                print(f"CFG truncated after step {step}/{total_steps}")
+            return callback_kwargs
+        hook.converged = False
+        hook.deepcache = None
+        return hook
+
+    def _watch_guidance(self, cfg_hook, cfg_threshold, pipeline):
+        """
+        Registers a UNet forward hook that measures how much guidance still changes the
+        prediction (|cond - uncond| / |cond|) and flags cfg_hook once it drops below
+        cfg_threshold. pipeline is the one running the denoising loop. Returns the hook
+        handle, or None.
+        """
+        if cfg_hook is None or not cfg_threshold:
+            return None
+        unet = getattr(pipeline.unet, "_orig_mod", pipeline.unet)
+
+        def forward_hook(module, inputs, output):
+            if not pipeline.do_classifier_free_guidance:
+                return
+            noise_pred = output[0] if isinstance(output, tuple) else output.sample
+            noise_uncond, noise_cond = noise_pred.float().chunk(2)
+            delta = ((noise_cond - noise_uncond).norm() / noise_cond.norm().clamp_min(1e-6)).item()
+            if delta < cfg_threshold:
+                cfg_hook.converged = True
+        return unet.register_forward_hook(forward_hook)
+
+    def _preview_hook(self, indices, on_preview, total_steps, size):
+        """Returns a step hook that sends latent previews every preview_every steps."""
+        if not on_preview or not self.preview_every:
+            return None
+
+        def hook(pipe, step_index, timestep, callback_kwargs):
+            step = step_index + 1
+            if step % self.preview_every == 0 and step < total_steps:
+                try:
+                    previews = self.preview_decoder.decode(callback_kwargs["latents"], size=size)
+                    on_preview(indices, previews, step, total_steps)
+                except Exception as e:
+                    print(f"Preview failed: {e}")
+        return hook
+
+    def _run_pipeline(self, prompt, negative_prompt, height, width, steps, generator, guidance_scale=7.5, callback=None, output_type="pil", init_latents=None, strength=None):
+        """
+        Runs the denoising loop; returns PIL images, or a latents tensor for output_type="latent".
+        With init_latents the loop is img2img: it starts from those latents, noised to strength.
+        """
+        if self.backend == "onnx":
+            return self._run_onnx_pipeline(prompt, negative_prompt, height, width, steps, generator, guidance_scale, callback)
+
+        # Repeated prompts (shared negative prompts, style suffixes) skip the text encoder
+        pipeline_kwargs = {
+            "prompt_embeds": self._get_prompt_embeds(prompt),
+            "negative_prompt_embeds": self._get_prompt_embeds(negative_prompt),
+            "num_inference_steps": steps,
+            "guidance_scale": guidance_scale,
+            "generator": generator,
+            "callback_on_step_end": callback,
+            "callback_on_step_end_tensor_inputs": ["latents", "prompt_embeds"],
+            "output_type": output_type
+        }
+        if init_latents is not None:
+            # 4-channel tensors are taken as latents, so the VAE encoder is skipped
+            images = self._get_img2img_pipeline()(image=init_latents, strength=strength, **pipeline_kwargs).images
+        else:
+            images = self.pipeline(height=height, width=width, **pipeline_kwargs).images
+        print(f"Embedding cache: {self.embedding_cache.stats()}")
+        return images
+
+    def _get_img2img_pipeline(self):
+        """img2img pipeline sharing the loaded pipeline's modules (no extra weights in memory)."""
+        if self._img2img_pipeline is None:
+            self._img2img_pipeline = StableDiffusionImg2ImgPipeline(**self.pipeline.components, requires_safety_checker=False)
+        # set_scheduler swaps the text-to-image pipeline's scheduler
+        self._img2img_pipeline.scheduler = self.pipeline.scheduler
+        return self._img2img_pipeline
+
+    def _run_onnx_pipeline(self, prompts, negative_prompts, height, width, steps, generators, guidance_scale, callback=None):
+        """
+        Runs the ONNX Runtime pipeline. Initial latents are drawn from the per-frame
+        torch generators exactly like diffusers does, so seeds give the same noise on
+        both backends.
+        optimum >= 1.23 pipelines share diffusers' __call__ (torch latents,
+        callback_on_step_end); older ones take numpy latents and a legacy per-step
+        callback, whose numpy latents are handed to the step hooks as tensors.
+        """
+        shape = (1, 4, height // 8, width // 8)
+        latents = torch.cat([torch.randn(shape, generator=g, dtype=torch.float32) for g in generators])
+
+        if "callback_on_step_end" in inspect.signature(self.pipeline.__call__).parameters:
+            return self.pipeline(
+                list(prompts),
+                negative_prompt=list(negative_prompts),
+                num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                height=height,
+                width=width,
+                latents=latents,
+                callback_on_step_end=callback
+            ).images
+
+        legacy_callback = None
+        if callback:
+            def legacy_callback(step_index, timestep, step_latents):
+                callback(self.pipeline, step_index, timestep, {"latents": torch.from_numpy(step_latents)})
 
-    def _run_pipeline(self, prompt, negative_prompt, height, width, steps, generator, guidance_scale=7.5):
         return self.pipeline(
-            prompt,
-            negative_prompt=negative_prompt,
+            list(prompts),
+            negative_prompt=list(negative_prompts),
             num_inference_steps=steps,
             guidance_scale=guidance_scale,
-            generator=generator,
             height=height,
-            width=width
-        ).images[0]
+            width=width,
+            latents=latents.numpy(),
+            callback=legacy_callback,
+            callback_steps=1
+        ).images
+
+    def _get_prompt_embeds(self, prompts):
+        """Returns batched text embeddings for a list of prompts, served from the embedding cache."""
+        device = self.pipeline._execution_device
+        dtype = self.pipeline.text_encoder.dtype
+        embeds = [
+            self.embedding_cache.get(self._text_encoder_id(), text, self._encode_prompt).to(device=device, dtype=dtype)
+            for text in prompts
+        ]
+        return torch.cat(embeds)
+
+    def _text_encoder_id(self):
+        """
+        Embedding cache namespace; the int8 text encoder and bfloat16 autocast
+        (torch-optimized) produce different embeddings.
+        """
+        namespace = f"{self.model_id}+{self.quantize}" if self.quantize else self.model_id
+        return f"{namespace}+bf16" if self.use_bf16 else namespace
+
+    def _encode_prompt(self, text):
+        """Runs the CLIP text encoder the same way StableDiffusionPipeline.encode_prompt does."""
+        tokenizer = self.pipeline.tokenizer
+        text_inputs = tokenizer(
+            text,
+            padding="max_length",
+            max_length=tokenizer.model_max_length,
+            truncation=True,
+            return_tensors="pt"
+        )
+        with torch.no_grad():
+            return self.pipeline.text_encoder(text_inputs.input_ids.to(self.pipeline._execution_device))[0]
 
     def add_frame(self, image):
         """Adds a simple frame to the image for educational purposes."""
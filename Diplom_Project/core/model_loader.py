@@ -0,0 +1,68 @@
+import threading
+import time
+
+class ModelLoader:
+    """
+    Imports and builds heavy models on background threads so the UI can start
+    right away. Callers that need a model before it is ready block in get()
+    instead of failing.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._models = {}
+        self._errors = {}
+        self._ready = {}
+        self.load_times = {}
+
+    def register(self, name, factory):
+        """Registers a zero-argument factory that imports and constructs a model."""
+        self._factories[name] = factory
+        self._ready[name] = threading.Event()
+
+    def start(self):
+        """Starts loading every registered model in parallel."""
+        for name in self._factories:
+            thread = threading.Thread(target=self._load, args=(name,), name=f"load-{name}", daemon=True)
+            thread.start()
+
+    def get(self, name, timeout=None):
+        """Returns a loaded model, waiting for its background load to finish."""
+        if not self._ready[name].wait(timeout):
+            raise TimeoutError(f"Model '{name}' is still loading")
+        if name in self._errors:
+            raise RuntimeError(f"Model '{name}' failed to load: {self._errors[name]}")
+        return self._models[name]
+
+    def is_ready(self, name=None):
+        """Checks one model, or all models when name is None."""
+        names = [name] if name else list(self._ready)
+        return all(self._ready[n].is_set() for n in names)
+
+    def wait_all(self, timeout=None):
+        for event in self._ready.values():
+            event.wait(timeout)
+
+    def status(self):
+        """Returns {name: "loading" | "ready" | "error: ..."} for health reporting."""
+        result = {}
+        for name, event in self._ready.items():
+            if not event.is_set():
+                result[name] = "loading"
+            elif name in self._errors:
+                result[name] = f"error: {self._errors[name]}"
+            else:
+                result[name] = "ready"
+        return result
+
+    def _load(self, name):
+        start = time.perf_counter()
+        try:
+            self._models[name] = self._factories[name]()
+        except Exception as e:
+            print(f"Failed to load {name}: {e}")
+            self._errors[name] = str(e)
+        finally:
+            self.load_times[name] = time.perf_counter() - start
+            print(f"{name} loaded in {self.load_times[name]:.1f}s")
+            self._ready[name].set()
@@ -0,0 +1,35 @@
+import os
+import shutil
+
+def get_export_dir(model_id, cache_dir):
+    """Directory holding the ONNX export of model_id."""
+    return os.path.join(cache_dir, "onnx", model_id.replace("/", "--"))
+
+def load_onnx_pipeline(model_id, cache_dir):
+    """
+    Returns an ONNX Runtime Stable Diffusion pipeline on the CPU execution provider.
+    The text encoder, UNet and VAE are exported once into the cache directory;
+    later loads reuse the exported graphs. The export uses dynamic spatial axes,
+    so one export serves every resolution.
+    """
+    # Optional dependency: optimum[onnxruntime]
+    from optimum.onnxruntime import ORTStableDiffusionPipeline
+
+    export_dir = get_export_dir(model_id, cache_dir)
+    if os.path.exists(os.path.join(export_dir, "model_index.json")):
+        print(f"Loading ONNX export from {export_dir}")
+        return ORTStableDiffusionPipeline.from_pretrained(export_dir, provider="CPUExecutionProvider")
+
+    print(f"Exporting {model_id} to ONNX (one-time)...")
+    pipeline = ORTStableDiffusionPipeline.from_pretrained(model_id, export=True, provider="CPUExecutionProvider")
+
+    # Write to a temporary directory first so an interrupted export is never picked up
+    tmp_dir = export_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    pipeline.save_pretrained(tmp_dir)
+    if os.path.exists(export_dir):
+        shutil.rmtree(export_dir)
+    os.replace(tmp_dir, export_dir)
+    print(f"ONNX export saved to {export_dir}")
+    return pipeline
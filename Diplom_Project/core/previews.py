@@ -0,0 +1,55 @@
+import torch
+from PIL import Image
+
+# Linear projection from the 4 SD 1.x latent channels to RGB.
+# Good enough to judge composition and colors without running the VAE.
+LATENT_RGB_FACTORS = [
+    #   R        G        B
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+]
+
+class PreviewDecoder:
+    """
+    Turns intermediate latents into cheap preview images.
+    method="linear" uses a fixed latent-to-RGB projection, method="taesd" uses the
+    tiny TAESD autoencoder and falls back to the projection if it can't be loaded.
+    """
+
+    TAESD_MODEL_ID = "madebyollin/taesd"
+
+    def __init__(self, method="linear", device="cpu"):
+        self.method = method
+        self.device = device
+        self.taesd = None
+
+    def decode(self, latents, size=None):
+        """Returns a list of PIL previews, one per latent in the batch."""
+        with torch.no_grad():
+            if self.method == "taesd" and self._load_taesd():
+                rgb = self.taesd.decode(latents.to(self.device, self.taesd.dtype)).sample
+                rgb = (rgb / 2 + 0.5).clamp(0, 1).permute(0, 2, 3, 1)
+            else:
+                factors = torch.tensor(LATENT_RGB_FACTORS, device=latents.device)
+                rgb = torch.einsum("bchw,cr->bhwr", latents.float(), factors)
+                rgb = ((rgb + 1) / 2).clamp(0, 1)
+            arrays = rgb.mul(255).byte().cpu().numpy()
+
+        previews = [Image.fromarray(array) for array in arrays]
+        if size:
+            previews = [preview.resize(size, Image.BILINEAR) for preview in previews]
+        return previews
+
+    def _load_taesd(self):
+        if self.taesd is not None:
+            return True
+        try:
+            from diffusers import AutoencoderTiny
+            self.taesd = AutoencoderTiny.from_pretrained(self.TAESD_MODEL_ID).to(self.device)
+            return True
+        except Exception as e:
+            print(f"Failed to load TAESD preview decoder, using linear previews: {e}")
+            self.method = "linear"
+            return False
@@ -0,0 +1,35 @@
+# Speed/quality profiles.
+# Each profile bundles generation shortcuts that trade a little quality for speed:
+#   cfg_cutoff    - fraction of steps after which classifier-free guidance stops and
+#                   only the conditional UNet branch runs (None keeps CFG for every step)
+#   cfg_threshold - stop CFG earlier once the relative difference between the conditional
+#                   and unconditional predictions drops below this value (None disables)
+#   deepcache_interval - run the full UNet only every k steps and reuse the cached deep
+#                   up-block features in between (None or 1 disables)
+SPEED_PROFILES = {
+    "quality": {
+        "label": "Качество",
+        "cfg_cutoff": None,
+        "cfg_threshold": None,
+        "deepcache_interval": None,
+    },
+    "balanced": {
+        "label": "Баланс",
+        "cfg_cutoff": 0.8,
+        "cfg_threshold": None,
+        "deepcache_interval": 2,
+    },
+    "fast": {
+        "label": "Скорость",
+        "cfg_cutoff": 0.6,
+        "cfg_threshold": 0.05,
+        "deepcache_interval": 3,
+    },
+}
+
+def get_profile(name):
+    """Returns the profile settings, falling back to "quality" for unknown names."""
+    if name not in SPEED_PROFILES:
+        print(f"Unknown speed profile '{name}', using quality")
+        name = "quality"
+    return SPEED_PROFILES[name]
@@ -0,0 +1,48 @@
+import os
+
+import torch
+
+# Pipeline components that get int8 dynamic quantization of their Linear layers
+# (UNet attention/feed-forward projections and the CLIP text encoder).
+QUANTIZED_COMPONENTS = ("unet", "text_encoder")
+
+def _library_versions():
+    """The cached state dicts are tied to the module layouts of these libraries."""
+    import diffusers
+    import transformers
+    return "-".join([
+        f"torch{torch.__version__.split('+')[0]}",
+        f"diffusers{diffusers.__version__}",
+        f"transformers{transformers.__version__}",
+    ])
+
+def get_quantized_dir(model_id, cache_dir):
+    return os.path.join(cache_dir, "quantized", f"{model_id.replace('/', '--')}-int8-{_library_versions()}")
+
+def quantize_components(pipeline, model_id, cache_dir):
+    """
+    Applies int8 dynamic quantization to the pipeline's fp32 components in place.
+    quantize_dynamic gives the quantized module layout; if a state dict for it is cached
+    (same model and library versions), it is loaded into that layout with
+    weights_only=True, otherwise the fresh int8 state dict is cached.
+    """
+    quantized_dir = get_quantized_dir(model_id, cache_dir)
+    os.makedirs(quantized_dir, exist_ok=True)
+    for name in QUANTIZED_COMPONENTS:
+        module = getattr(pipeline, name)
+        module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        setattr(pipeline, name, module)
+
+        path = os.path.join(quantized_dir, f"{name}.pt")
+        if os.path.exists(path):
+            try:
+                module.load_state_dict(torch.load(path, weights_only=True))
+                print(f"Loaded int8 {name} state dict from {path}")
+                continue
+            except Exception as e:
+                print(f"Cached int8 {name} state dict doesn't match, replacing it: {e}")
+        try:
+            torch.save(module.state_dict(), path)
+        except Exception as e:
+            print(f"Failed to cache quantized {name}: {e}")
+    print(f"Quantized {', '.join(QUANTIZED_COMPONENTS)} to int8, cache: {quantized_dir}")
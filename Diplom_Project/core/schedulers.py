@@ -0,0 +1,56 @@
+import importlib
+
+# Scheduler registry.
+# Each entry holds the diffusers scheduler class name (None keeps the checkpoint's own scheduler),
+# extra config overrides and the step budget the scheduler reaches good quality with.
+# "guidance_scale" overrides the mode-dependent guidance where the sampler needs it.
+SCHEDULERS = {
+    "default": {
+        "label": "PNDM (по умолчанию модели)",
+        "cls": None,
+        "config": {},
+        "steps": 25,
+    },
+    "dpmpp_2m": {
+        "label": "DPM-Solver++ 2M Karras",
+        "cls": "DPMSolverMultistepScheduler",
+        "config": {"algorithm_type": "dpmsolver++", "use_karras_sigmas": True},
+        "steps": 15,
+    },
+    "euler_a": {
+        "label": "Euler Ancestral",
+        "cls": "EulerAncestralDiscreteScheduler",
+        "config": {},
+        "steps": 20,
+    },
+    "unipc": {
+        "label": "UniPC",
+        "cls": "UniPCMultistepScheduler",
+        "config": {},
+        "steps": 12,
+    },
+    "lcm": {
+        "label": "LCM (нужен LCM-чекпоинт или LoRA)",
+        "cls": "LCMScheduler",
+        "config": {},
+        "steps": 4,
+        "guidance_scale": 1.5,
+        "requires_lcm": True,
+    },
+}
+
+def get_available_schedulers(lcm_available=False):
+    """Returns registry names usable with the current model."""
+    return [
+        name for name, spec in SCHEDULERS.items()
+        if lcm_available or not spec.get("requires_lcm")
+    ]
+
+def build_scheduler(name, base_config):
+    """Creates a scheduler from the pipeline's original scheduler config."""
+    spec = SCHEDULERS[name]
+    if spec["cls"] is None:
+        return None
+    # diffusers is imported here so the registry stays cheap to import
+    scheduler_cls = getattr(importlib.import_module("diffusers"), spec["cls"])
+    return scheduler_cls.from_config(base_config, **spec["config"])
@@ -3,16 +3,22 @@ import os
 import time
 from datetime import datetime
 
+import numpy as np
+
 class SessionManager:
     def __init__(self, storage_path="sessions"):
         self.storage_path = storage_path
         if not os.path.exists(storage_path):
             os.makedirs(storage_path)
 
-    def save_session(self, session_id, history, character, style, seed, educational_mode=False, images=None, chat_history=None):
+    def save_session(self, session_id, history, character, style, seed, educational_mode=False, images=None, chat_history=None, generation_info=None, frames=None, context=None):
         """
         Saves the current session state and images to a timestamped folder.
         Structure: outputs/session_{id}/{timestamp}/
+        generation_info holds the image generation settings (scheduler, steps, speed profile...).
+        frames holds one record per image (prompt, negative_prompt, seed, latents); the
+        latents are stored as compressed fp16 img_{idx}.npz files next to the PNGs.
+        context is the structured chat history (StoryContext.to_dict()).
         """
         # Create structured path
         # Timestamp format: YYYY-MM-DD_HH-MM-SS
@@ -42,6 +48,22 @@ class SessionManager:
                 except Exception as e:
                     print(f"Failed to save image {img_filename}: {e}")
 
+        latent_paths = []
+        frame_params = []
+        for idx, frame in enumerate(frames or []):
+            frame_params.append({key: value for key, value in frame.items() if key != "latents"})
+            latent = frame.get("latents")
+            if latent is None:
+                latent_paths.append(None)
+                continue
+            latent_path = os.path.join(sequence_dir, f"img_{idx}.npz")
+            try:
+                np.savez_compressed(latent_path, latents=np.asarray(latent, dtype=np.float16))
+                latent_paths.append(latent_path)
+            except Exception as e:
+                print(f"Failed to save latents {latent_path}: {e}")
+                latent_paths.append(None)
+
         data = {
             "session_id": session_id,
             "timestamp": timestamp_str,
@@ -50,8 +72,12 @@ class SessionManager:
             "seed": seed,
             "educational_mode": educational_mode,
             "history": history,
+            "context": context or {},
             "chat_history": chat_history or [], # Save structured list
-            "saved_images": image_paths
+            "generation": generation_info or {},
+            "saved_images": image_paths,
+            "saved_latents": latent_paths,
+            "frames": frame_params
         }
         
         # Save JSON in the same timestamped folder
@@ -84,6 +110,17 @@ class SessionManager:
             print(f"Failed to import session from {file_path}: {e}")
             return None
 
+    def load_latents(self, path):
+        """Loads latents saved by save_session; returns None if the file is missing or unreadable."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return data["latents"]
+        except Exception as e:
+            print(f"Failed to load latents from {path}: {e}")
+            return None
+
     def load_session(self, session_id):
         """
         Loads a session by ID.
@@ -0,0 +1,59 @@
+import re
+
+from transformers import StoppingCriteria
+
+# Stopping criteria for StoryTeller's sampling loop. Unlike in transformers.generate,
+# input_ids holds only the generated tokens (never the prompt), so markers that also
+# occur in the prompt do not stop generation right away.
+
+class StopOnStrings(StoppingCriteria):
+    """
+    Stops once the generated text contains one of the stop strings, e.g. the next
+    speaker's role marker ("Игрок:") or a blank line. The caller cuts the text there.
+    """
+
+    def __init__(self, tokenizer, stop_strings):
+        self.tokenizer = tokenizer
+        self.stop_strings = [text for text in stop_strings if text]
+        self.matched = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        # Leading whitespace right after the prompt's role marker is not a blank line
+        text = self.tokenizer.decode(input_ids[0], skip_special_tokens=True).lstrip()
+        for stop_string in self.stop_strings:
+            if stop_string in text:
+                self.matched = stop_string
+                return True
+        return False
+
+FRAME_MARKER = re.compile(r"(?:Кадр|Frame)\s*(\d+)\s*:", re.I)
+
+class StopAfterFrames(StoppingCriteria):
+    """
+    Storyboards: stops when the description of the last frame is complete, i.e. its
+    line has ended or a marker of a frame beyond the requested count appears.
+    """
+
+    def __init__(self, tokenizer, count):
+        self.tokenizer = tokenizer
+        self.count = count
+        self.matched = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        text = self.tokenizer.decode(input_ids[0], skip_special_tokens=True)
+        markers = list(FRAME_MARKER.finditer(text))
+        if not markers:
+            return False
+        last = markers[-1]
+        number = int(last.group(1))
+        if number > self.count or (number == self.count and "\n" in text[last.end():].lstrip()):
+            self.matched = f"frame {number}"
+            return True
+        return False
+
+def cut_at_stop_strings(text, stop_strings):
+    """Drops everything from the first stop string on."""
+    for stop_string in stop_strings:
+        if stop_string and stop_string in text:
+            text = text.split(stop_string)[0]
+    return text
@@ -0,0 +1,65 @@
+import threading
+
+class StoryContext:
+    """
+    Structured chat history of a session: a pinned header (topic, style), the list of
+    (role, text) turns and a rolling summary of the turns that no longer fit into the
+    model's context window.
+
+    The prompt window starts at window_start and only moves forward when the newest
+    turns overflow the token budget, so consecutive prompts share a stable prefix
+    (see StoryTeller.build_prompt). Turns before window_start are folded into
+    `summary` once, in the background.
+    """
+
+    def __init__(self, header=""):
+        self.header = header
+        self.turns = []
+        self.summary = ""
+        self.summarized = 0  # Number of leading turns covered by summary
+        self.window_start = 0  # First turn that is still sent verbatim
+        self.lock = threading.Lock()
+        self.summarizing = False
+
+    def add_turn(self, role, text):
+        with self.lock:
+            self.turns.append((role, text))
+
+    def render(self, start=0):
+        """Plain-text transcript ("Role: text" lines) from turn start on, header included."""
+        lines = [self.header] if self.header else []
+        lines += [f"{role}: {text}" for role, text in self.turns[start:]]
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "header": self.header,
+            "turns": [list(turn) for turn in self.turns],
+            "summary": self.summary,
+            "summarized": self.summarized,
+            "window_start": self.window_start,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        context = cls(data.get("header", ""))
+        context.turns = [tuple(turn) for turn in data.get("turns", [])]
+        context.summary = data.get("summary", "")
+        context.summarized = data.get("summarized", 0)
+        context.window_start = data.get("window_start", 0)
+        return context
+
+    @classmethod
+    def from_text(cls, history):
+        """Rebuilds a context from a plain-text history of sessions saved before turns were stored."""
+        lines = [line for line in (history or "").split("\n") if line.strip()]
+        context = cls(lines[0] if lines else "")
+        for line in lines[1:]:
+            role, separator, text = line.partition(": ")
+            if separator and len(role) < 20:
+                context.turns.append((role, text))
+            elif context.turns:
+                # Continuation line of a multi-line turn
+                role, text = context.turns[-1]
+                context.turns[-1] = (role, f"{text}\n{line}")
+        return context
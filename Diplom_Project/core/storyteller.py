@@ -1,9 +1,27 @@
 from transformers import pipeline, set_seed
+from transformers import LogitsProcessorList, RepetitionPenaltyLogitsProcessor, TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+from collections import OrderedDict
+from core.stopping import StopAfterFrames, StopOnStrings, cut_at_stop_strings
+from core.story_context import StoryContext
+from utils.config import config
+import queue
+import threading
+import time
 import torch
 
 class StoryTeller:
+    # Chat sessions whose KV cache is kept; the least recently used one is dropped first
+    MAX_CACHED_SESSIONS = 4
+    # When the window overflows, older turns are dropped until the prompt fits into this
+    # fraction of the budget, so the window start (and the cached prefix) moves rarely
+    WINDOW_SLACK = 0.75
+
     def __init__(self, model_name="ai-forever/rugpt3small_based_on_gpt2", device="cpu"):
         self.device = device
+        # session_id -> (token ids covered by the cache, past_key_values)
+        self._kv_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.last_metrics = None
         print(f"Loading StoryTeller model ({model_name}) on {self.device}...")
         try:
             # Explicitly set device=-1 for CPU in pipeline, or 0 for CUDA
@@ -15,12 +33,27 @@ class StoryTeller:
             print(f"Failed to load StoryTeller model: {e}")
             self.generator = None
 
-    def generate_response(self, context, user_input, educational_mode=False, max_length=150):
+    def generate_response(self, context, user_input, educational_mode=False, max_length=150, session_id=None):
         """
         Generates the next part of the story based on context and user input.
+        context is a StoryContext (or a plain header string); the prompt is built by
+        build_prompt within the model's token budget.
+        With a session_id the attention KV cache of the previous turn is reused, so only
+        the text appended since then is encoded.
+        """
+        response = ""
+        for response in self.stream_response(context, user_input, educational_mode=educational_mode, session_id=session_id):
+            pass
+        return response
+
+    def stream_response(self, context, user_input, educational_mode=False, session_id=None):
+        """
+        Streaming variant of generate_response: yields the answer text generated so far
+        after every sampled token; the last value is the final answer.
         """
         if not self.generator:
-            return "Ведущий: (Модель молчит. Проверьте подключение.)"
+            yield "Ведущий: (Модель молчит. Проверьте подключение.)"
+            return
 
         # Construct prompt - Using Russian prompts
         # Smart detection: If input is long (>50 chars), it's likely a story/narrative, not a student question.
@@ -30,46 +63,251 @@ class StoryTeller:
         if educational_mode and not is_narrative:
              # Strict Educational Mode (Topics, Questions)
              # Try to keep it strict
-             prompt = f"{context}\nСтудент: {user_input}\nЛектор:"
+             tail = f"Студент: {user_input}\nЛектор:"
         elif is_narrative:
              # Narrative Mode (Story/Comic) - Just continue the text or use a storyteller persona
              # We use a neutral prompt to let the model continue the story naturally
-             prompt = f"{context}\nТекст: {user_input}\nПродолжение:"
+             tail = f"Текст: {user_input}\nПродолжение:"
         else:
-             prompt = f"{context}\nИгрок: {user_input}\nМастер:"
-        
-        # Truncate context if it gets too long
-        if len(prompt) > 2000:
-            prompt = "..." + prompt[-2000:]
-            
-        # ... generation code ...
+             tail = f"Игрок: {user_input}\nМастер:"
+
+        if isinstance(context, str):
+            context = StoryContext(context)
+        prompt = self.build_prompt(context, tail, max_new_tokens=150)
+        # The model tends to go on with the next speaker's line; stop at the role markers
+        stop_strings = config.get("storyteller.stop_strings", [])
+        stopping_criteria = [StopOnStrings(self.generator.tokenizer, stop_strings)] if stop_strings else None
 
         try:
             # Generate
-            response = self.generator(
+            for new_content in self._stream(
                 prompt,
-                max_new_tokens=150, 
-                num_return_sequences=1,
+                max_new_tokens=150,
+                session_id=session_id,
                 temperature=0.8,
                 top_k=50,
                 top_p=0.95,
                 repetition_penalty=1.2,
-                do_sample=True,
-                pad_token_id=50256
-            )
-            
-            full_text = response[0]['generated_text']
-            # Extract just the new part
-            new_content = full_text[len(prompt):].strip()
-            
-            # Clean up potential partial sentences or "Player:" hallucinations
-            if "Player:" in new_content:
-                new_content = new_content.split("Player:")[0].strip()
-            
-            return new_content
+                stopping_criteria=stopping_criteria
+            ):
+                # Clean up potential partial sentences or "Player:" hallucinations
+                yield cut_at_stop_strings(new_content.lstrip(), stop_strings + ["Player:"]).strip()
         except Exception as e:
             print(f"Error generating story: {e}")
-            return "Something went wrong in the dungeon..."
+            yield "Something went wrong in the dungeon..."
+            return
+
+        # Fold the turns that left the window into the summary while the frames render
+        self.schedule_summary(context)
+
+    def count_tokens(self, text):
+        return len(self.generator.tokenizer(text).input_ids)
+
+    def build_prompt(self, context, tail, max_new_tokens=150):
+        """
+        Builds the prompt from a StoryContext: the pinned header, the rolling summary of
+        older turns, as many of the newest turns as fit into the token budget and the tail
+        (the current request). The budget is storyteller.context_tokens minus the tokens
+        reserved for the answer.
+        """
+        max_positions = getattr(self.generator.model.config, "n_positions", 2048)
+        budget = min(config.get("storyteller.context_tokens", 1024), max_positions) - max_new_tokens
+
+        with context.lock:
+            pinned = [context.header] if context.header else []
+            if context.summary:
+                pinned.append(f"Ранее: {context.summary}")
+            turns = [f"{role}: {text}" for role, text in context.turns]
+            turn_tokens = [self.count_tokens(line) for line in turns]
+            fixed = sum(self.count_tokens(line) for line in pinned + [tail])
+            available = budget - fixed
+
+            start = min(context.window_start, len(turns))
+            if sum(turn_tokens[start:]) > available:
+                # Slide the window: drop the oldest turns until the rest fits with some slack
+                while start < len(turns) and sum(turn_tokens[start:]) > available * self.WINDOW_SLACK:
+                    start += 1
+                context.window_start = start
+
+        lines = pinned + turns[start:] + [tail]
+        prompt = "\n".join(lines)
+        if fixed > budget:
+            # A single oversized request: keep its end, cut at a token boundary
+            ids = self.generator.tokenizer(prompt).input_ids[-budget:]
+            prompt = self.generator.tokenizer.decode(ids)
+        return prompt
+
+    def schedule_summary(self, context):
+        """Starts folding the turns that fell out of the window into the summary on a background thread."""
+        with context.lock:
+            if context.summarizing or context.window_start <= context.summarized:
+                return
+            context.summarizing = True
+            upto = context.window_start
+        threading.Thread(target=self._summarize, args=(context, upto), name="story-summary", daemon=True).start()
+
+    def _summarize(self, context, upto):
+        """Computes the rolling summary once per window move; it is only read by later prompts."""
+        try:
+            folded = [f"{role}: {text}" for role, text in context.turns[context.summarized:upto]]
+            source = "\n".join(([context.summary] if context.summary else []) + folded)
+            summary = self._generate(
+                f"{source}\nКратко:",
+                max_new_tokens=config.get("storyteller.summary_tokens", 96),
+                temperature=0.3,
+                top_k=50,
+                repetition_penalty=1.2
+            ).strip().split("\n")[0]
+            if not summary:
+                # Fall back to the first sentence of every folded turn
+                summary = " ".join(([context.summary] if context.summary else []) + [text.split(". ")[0] for _, text in context.turns[context.summarized:upto]])
+            # Keep the summary itself bounded, newest events win
+            ids = self.generator.tokenizer(summary).input_ids
+            limit = config.get("storyteller.summary_tokens", 96)
+            if len(ids) > limit:
+                summary = self.generator.tokenizer.decode(ids[-limit:]).strip()
+            with context.lock:
+                context.summary = summary
+                context.summarized = upto
+            print(f"StoryTeller: summarized {upto} turns into {self.count_tokens(summary)} tokens")
+        except Exception as e:
+            print(f"Error summarizing story: {e}")
+        finally:
+            context.summarizing = False
+
+    def _generate(self, prompt, max_new_tokens, session_id=None, **sampling):
+        """Samples a continuation of prompt and returns only the new text."""
+        tokenizer = self.generator.tokenizer
+        prompt_ids = tokenizer(prompt).input_ids
+        with self._lock:
+            new_ids = list(self._sample(prompt_ids, max_new_tokens, session_id, **sampling))
+        return tokenizer.decode(new_ids, skip_special_tokens=True)
+
+    def _stream(self, prompt, max_new_tokens, session_id=None, **sampling):
+        """
+        Runs _sample on a worker thread and yields the decoded new text after every token,
+        so callers can show partial answers. Closing the iterator stops the sampling.
+        """
+        tokenizer = self.generator.tokenizer
+        prompt_ids = tokenizer(prompt).input_ids
+        updates = queue.Queue()
+        stop = threading.Event()
+
+        def worker():
+            try:
+                with self._lock:
+                    sampler = self._sample(prompt_ids, max_new_tokens, session_id, **sampling)
+                    new_ids = []
+                    try:
+                        for token_id in sampler:
+                            new_ids.append(token_id)
+                            # A token can end inside a multi-byte character; hold that part back
+                            updates.put(tokenizer.decode(new_ids, skip_special_tokens=True).rstrip("\ufffd"))
+                            if stop.is_set():
+                                break
+                    finally:
+                        sampler.close()
+            except Exception as e:
+                updates.put(e)
+            finally:
+                updates.put(None)
+
+        threading.Thread(target=worker, name="story-stream", daemon=True).start()
+        try:
+            while True:
+                update = updates.get()
+                if update is None:
+                    break
+                if isinstance(update, Exception):
+                    raise update
+                yield update
+        finally:
+            stop.set()
+
+    def _sample(self, prompt_ids, max_new_tokens, session_id=None, temperature=1.0, top_k=0, top_p=1.0, repetition_penalty=1.0, stopping_criteria=None):
+        """
+        Token-by-token sampling loop; yields the generated token ids.
+        The longest common token prefix with the session's previous sequence is served
+        from its cached past_key_values and only the rest of the prompt is run through
+        the model. The prefix is recomputed only when it changed (the window slid).
+        stopping_criteria (core.stopping) are checked after every token; the token that
+        triggered a stop is still yielded so the caller can cut the text at the marker.
+        """
+        model = self.generator.model
+        processors = LogitsProcessorList()
+        if repetition_penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+        if temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(temperature))
+        if top_k:
+            processors.append(TopKLogitsWarper(top_k))
+        if top_p < 1.0:
+            processors.append(TopPLogitsWarper(top_p))
+
+        started = time.perf_counter()
+        past, reused = self._restore_cache(session_id, prompt_ids)
+        sequence = torch.tensor([prompt_ids], device=model.device)
+        pending = sequence[:, reused:]
+        self.last_metrics = {"prompt_tokens": len(prompt_ids), "reused_tokens": reused, "time_to_first_token": None, "new_tokens": 0, "stopped_by": None, "tokens_saved": 0}
+        completed = False
+        try:
+            with torch.no_grad():
+                for _ in range(max_new_tokens):
+                    output = model(pending, past_key_values=past, use_cache=True)
+                    past = output.past_key_values
+                    scores = processors(sequence, output.logits[:, -1, :])
+                    next_token = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+                    sequence = torch.cat([sequence, next_token], dim=-1)
+                    pending = next_token
+                    if self.last_metrics["time_to_first_token"] is None:
+                        self.last_metrics["time_to_first_token"] = time.perf_counter() - started
+                    if next_token.item() == self.generator.tokenizer.eos_token_id:
+                        self.last_metrics["stopped_by"] = "eos"
+                        break
+                    self.last_metrics["new_tokens"] += 1
+                    yield next_token.item()
+                    if stopping_criteria and any(criteria(sequence[:, len(prompt_ids):], scores) for criteria in stopping_criteria):
+                        self.last_metrics["stopped_by"] = next((criteria.matched for criteria in stopping_criteria if criteria.matched), "criteria")
+                        break
+            completed = True
+            # Tokens not sampled compared to always running to max_new_tokens
+            self.last_metrics["tokens_saved"] = max_new_tokens - self.last_metrics["new_tokens"]
+        finally:
+            # Also runs when the consumer stops early. The last sampled token was never fed
+            # through the model, so the cache covers everything but it.
+            if past is not None and session_id is not None and (completed or pending.shape[1] == 1):
+                self._store_cache(session_id, sequence[0, :-1].tolist(), past)
+            print(f"StoryTeller: {self.last_metrics}")
+
+    def _restore_cache(self, session_id, prompt_ids):
+        """Returns (past_key_values cropped to the shared prefix, prefix length) or (None, 0)."""
+        if session_id is None or session_id not in self._kv_cache:
+            return None, 0
+        cached_ids, past = self._kv_cache.pop(session_id)
+        common = 0
+        for cached_id, prompt_id in zip(cached_ids, prompt_ids):
+            if cached_id != prompt_id:
+                break
+            common += 1
+        # At least one prompt token has to go through the model to get the next-token logits
+        common = min(common, len(prompt_ids) - 1)
+        if common <= 0:
+            return None, 0
+        return self._crop_cache(past, common), common
+
+    def _store_cache(self, session_id, token_ids, past):
+        self._kv_cache[session_id] = (token_ids, past)
+        self._kv_cache.move_to_end(session_id)
+        while len(self._kv_cache) > self.MAX_CACHED_SESSIONS:
+            self._kv_cache.popitem(last=False)
+
+    @staticmethod
+    def _crop_cache(past, length):
+        """Keeps the first length positions of a Cache object or of legacy (key, value) tuples."""
+        if hasattr(past, "crop"):
+            past.crop(length)
+            return past
+        return tuple(tuple(tensor[:, :, :length] for tensor in layer) for layer in past)
 
     def generate_visual_storyboard(self, topic, style, count=4):
         """
@@ -102,17 +340,18 @@ class StoryTeller:
         prompt = f"{system_instruction}\n"
         
         try:
-            response = self.generator(
+            # Stops as soon as the last requested frame is described
+            stopping_criteria = []
+            if config.get("storyteller.stop_on_frames", True):
+                stopping_criteria.append(StopAfterFrames(self.generator.tokenizer, count))
+            full_text = self._generate(
                 prompt,
                 max_new_tokens=300,
-                num_return_sequences=1,
                 temperature=0.7,
-                do_sample=True,
-                pad_token_id=50256
+                top_k=50,
+                stopping_criteria=stopping_criteria
             )
             
-            full_text = response[0]['generated_text'][len(prompt):]
-            
             # Parse frames
             frames = []
             current_frame = ""
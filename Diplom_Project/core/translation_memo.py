@@ -0,0 +1,69 @@
+import contextlib
+import os
+import sqlite3
+import threading
+
+class TranslationMemo:
+    """
+    Persistent translation memo in SQLite, keyed by (source, target, text).
+    Repeated fragments (topics, characters, style words) are translated only once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "source TEXT NOT NULL, target TEXT NOT NULL, text TEXT NOT NULL, translation TEXT NOT NULL, "
+                "PRIMARY KEY (source, target, text))"
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """One short-lived connection per operation, so the memo can be used from any thread."""
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def get_many(self, source, target, texts):
+        """Returns {text: translation} for the texts that are already memoized."""
+        texts = list(set(texts))
+        if not texts:
+            return {}
+        found = {}
+        with self._transaction() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(texts), 500):
+                chunk = texts[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT text, translation FROM translations WHERE source = ? AND target = ? AND text IN ({placeholders})",
+                    [source, target, *chunk]
+                )
+                found.update(rows)
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, source, target, translations):
+        """Stores {text: translation} pairs."""
+        if not translations:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations (source, target, text, translation) VALUES (?, ?, ?, ?)",
+                [(source, target, text, translation) for text, translation in translations.items()]
+            )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,15 +1,241 @@
-from deep_translator import GoogleTranslator
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from core.translation_memo import TranslationMemo
+from utils.config import config
+
+CYRILLIC = re.compile(r"[А-Яа-яЁё]")
+
+# Backends either translate a whole batch locally (translate_batch) or one text per
+# network request (translate_one); the Translator fans the latter out concurrently.
+
+class GoogleBackend:
+    """
+    Online translation through Google Translate (deep-translator).
+    GoogleTranslator keeps the request parameters on the instance, so concurrent
+    requests would swap texts; every thread gets its own instance.
+    """
+
+    def __init__(self, source, target):
+        from deep_translator import GoogleTranslator
+        self.factory = lambda: GoogleTranslator(source=source, target=target)
+        self.local = threading.local()
+
+    def translate_one(self, text):
+        translator = getattr(self.local, "translator", None)
+        if translator is None:
+            translator = self.local.translator = self.factory()
+        return translator.translate(text)
+
+class HTTPBackend:
+    """LibreTranslate-compatible HTTP API: POST {q, source, target} -> {translatedText}."""
+
+    def __init__(self, source, target, url=None, api_key=None, timeout=10):
+        self.source = source
+        self.target = target
+        self.url = url or "http://127.0.0.1:5000/translate"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def translate_one(self, text):
+        payload = {"q": text, "source": self.source, "target": self.target, "format": "text"}
+        if self.api_key:
+            payload["api_key"] = self.api_key
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))["translatedText"]
+
+class MarianBackend:
+    """
+    Offline in-process translation with a MarianMT (opus-mt) model.
+    The model is loaded on first use; a batch is translated in one forward pass.
+    """
+
+    def __init__(self, source, target, model_name=None, device="cpu"):
+        self.model_name = model_name or f"Helsinki-NLP/opus-mt-{source}-{target}"
+        self.device = device
+        self.model = None
+        self.tokenizer = None
+
+    def load(self):
+        if self.model is not None:
+            return
+        from transformers import MarianMTModel, MarianTokenizer
+        print(f"Loading translation model ({self.model_name})...")
+        self.tokenizer = MarianTokenizer.from_pretrained(self.model_name)
+        self.model = MarianMTModel.from_pretrained(self.model_name).to(self.device).eval()
+
+    def translate_batch(self, texts):
+        import torch
+        self.load()
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, num_beams=1, max_new_tokens=256)
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+class StubBackend:
+    """Deterministic offline backend for tests: tags the text with the target language."""
+
+    def __init__(self, source, target):
+        self.target = target
+
+    def translate_batch(self, texts):
+        return [f"[{self.target}] {text}" for text in texts]
+
+TRANSLATION_BACKENDS = {
+    "google": GoogleBackend,
+    "http": HTTPBackend,
+    "marian": MarianBackend,
+    "stub": StubBackend,
+}
 
 class Translator:
-    def __init__(self, source='ru', target='en'):
-        self.translator = GoogleTranslator(source=source, target=target)
+    def __init__(self, source='ru', target='en', backend=None):
+        self.source = source
+        self.target = target
+        self.backend_name = backend or config.get("translation.backend", "google")
+        if self.backend_name not in TRANSLATION_BACKENDS:
+            print(f"Unknown translation backend '{self.backend_name}', using google")
+            self.backend_name = "google"
+        self.backend = None
+
+        # Translated fragments are memoized on disk across runs (stub output is never stored)
+        self.memo = None
+        if config.get("translation.memo", True) and self.backend_name != "stub":
+            self.memo = TranslationMemo(os.path.join(config.get("paths.cache_dir", "cache"), "translations.sqlite"))
+        self.chars_total = 0
+        self.chars_sent = 0
+
+        # Online backends: parallel requests, retried with exponential backoff
+        self.concurrency = max(1, config.get("translation.concurrency", 4))
+        self.retries = config.get("translation.retries", 3)
+        self.backoff = config.get("translation.backoff", 0.5)
+
+    def _get_backend(self):
+        # Created lazily so that importing the translator stays cheap
+        if self.backend is None:
+            kwargs = {}
+            if self.backend_name == "marian" and config.get("translation.marian_model"):
+                kwargs["model_name"] = config.get("translation.marian_model")
+            if self.backend_name == "http":
+                kwargs["url"] = config.get("translation.http_url")
+                kwargs["api_key"] = config.get("translation.http_api_key")
+            self.backend = TRANSLATION_BACKENDS[self.backend_name](self.source, self.target, **kwargs)
+        return self.backend
 
     def translate(self, text):
         """Translates text from source language to target language."""
         if not text:
             return ""
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts):
+        """
+        Translates a list of texts. Prompts are mostly English style words around a short
+        Russian fragment, so texts are split into comma-separated fragments and only the
+        fragments that contain Cyrillic are translated, all together through translate_many.
+        Fragments that fail to translate are kept as they are.
+        """
+        split = [[fragment.strip() for fragment in (text or "").split(",")] for text in texts]
+        pending = [fragment for fragments in split for fragment in fragments if self._needs_translation(fragment)]
+        translations = dict(zip(pending, self.translate_many(pending)))
+
+        self.chars_total += sum(len(text or "") for text in texts)
+        print(f"Translation: {self.chars_sent} of {self.chars_total} characters sent to '{self.backend_name}' so far, "
+              f"memo: {self.memo.stats() if self.memo else 'off'}")
+        return [", ".join(translations.get(fragment, fragment) for fragment in fragments if fragment) for fragments in split]
+
+    def _needs_translation(self, fragment):
+        if not fragment:
+            return False
+        if self.source == "ru":
+            return bool(CYRILLIC.search(fragment))
+        return True
+
+    def translate_many(self, texts):
+        """
+        Translates a list of texts as a set: identical inputs are translated once and
+        memoized ones come from the on-disk memo. The rest go to the backend in one batch
+        (local models) or as up to `concurrency` parallel requests with retries (online
+        backends), so a whole sequence costs about one round trip. Texts that fail to
+        translate keep their original value.
+        """
+        translations, missing = self._lookup(texts)
+        if missing:
+            backend = self._get_backend()
+            if hasattr(backend, "translate_one"):
+                with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="translate") as pool:
+                    results = list(pool.map(self._translate_with_retry, missing))
+                fetched = {text: result for text, result in zip(missing, results) if result is not None}
+            else:
+                fetched = self._translate_local(missing)
+            self._store(fetched, missing)
+            translations.update(fetched)
+        return [translations.get(text, text) if text else "" for text in texts]
+
+    async def translate_many_async(self, texts):
+        """asyncio variant of translate_many; blocking backend calls run in worker threads."""
+        translations, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            backend = self._get_backend()
+            if hasattr(backend, "translate_one"):
+                semaphore = asyncio.Semaphore(self.concurrency)
+
+                async def fetch(text):
+                    async with semaphore:
+                        for attempt in range(self.retries + 1):
+                            try:
+                                return await asyncio.to_thread(backend.translate_one, text)
+                            except Exception as e:
+                                if attempt == self.retries:
+                                    print(f"Translation error: {e}")
+                                    return None
+                                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+                results = await asyncio.gather(*(fetch(text) for text in missing))
+                fetched = {text: result for text, result in zip(missing, results) if result is not None}
+            else:
+                fetched = await asyncio.to_thread(self._translate_local, missing)
+            await asyncio.to_thread(self._store, fetched, missing)
+            translations.update(fetched)
+        return [translations.get(text, text) if text else "" for text in texts]
+
+    def _lookup(self, texts):
+        """Deduplicates texts; returns (memoized translations, texts still to translate)."""
+        unique = list(dict.fromkeys(text for text in texts if text))
+        translations = self.memo.get_many(self.source, self.target, unique) if self.memo else {}
+        missing = [text for text in unique if text not in translations]
+        return translations, missing
+
+    def _store(self, fetched, sent):
+        self.chars_sent += sum(len(text) for text in sent)
+        if self.memo:
+            self.memo.put_many(self.source, self.target, fetched)
+
+    def _translate_local(self, texts):
         try:
-            return self.translator.translate(text)
+            return dict(zip(texts, self._get_backend().translate_batch(texts)))
         except Exception as e:
             print(f"Translation error: {e}")
-            return text  # Return original text if translation fails
+            return {}
+
+    def _translate_with_retry(self, text):
+        """One online request, retried with exponential backoff; None if every attempt failed."""
+        for attempt in range(self.retries + 1):
+            try:
+                return self._get_backend().translate_one(text)
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Translation error: {e}")
+                    return None
+                time.sleep(self.backoff * 2 ** attempt)
@@ -0,0 +1,67 @@
+"""
+Local stand-in for a LibreTranslate-compatible server, for testing the "http"
+translation backend (concurrency, retries, cache) without network access.
+
+POST /translate {"q": ..., "source": ..., "target": ...} answers
+{"translatedText": "[<target>] <q>"}. --delay simulates network latency and
+--fail-rate makes that share of requests fail with HTTP 503.
+
+Usage:
+    python translation_stub_server.py --port 5000 --delay 0.3 --fail-rate 0.2
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class TranslateHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    fail_rate = 0.0
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            self.send_error(400, "Invalid JSON")
+            return
+
+        time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            self.send_error(503, "Simulated failure")
+            return
+
+        body = json.dumps({"translatedText": f"[{payload.get('target', 'en')}] {payload.get('q', '')}"}, ensure_ascii=False)
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+def main():
+    parser = argparse.ArgumentParser(description="LibreTranslate-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before every answer")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    args = parser.parse_args()
+
+    TranslateHandler.delay = args.delay
+    TranslateHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer((args.host, args.port), TranslateHandler)
+    print(f"Translation stand-in listening on http://{args.host}:{args.port}/translate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -8,18 +8,61 @@ class Config:
         "model": {
             "text_generator": "distilgpt2",
             "image_generator": "stable-diffusion-v1-5/stable-diffusion-v1-5",
+            "lcm_lora": None,
+            "backend": "diffusers",
             "device_priority": "cuda"
         },
         "generation": {
             "default_steps": 25,
+            "scheduler": "dpmpp_2m",
+            "scheduler_steps": {},
+            "preview_every": 5,
+            "preview_decoder": "linear",
+            "cpu_backend": "default",
+            "cpu_threads": None,
+            "cpu_compile": True,
+            "cpu_quantization": None,
+            "pipelined_decode": True,
+            "profile": "quality",
+            "continuation_strength": 0.6,
+            "draft_size": 256,
+            "draft_step_fraction": 0.6,
+            "upscale_size": 768,
+            "upscale_strength": 0.35,
             "default_height": 512,
             "default_width": 512,
             "guidance_scale": 7.5
         },
+        "translation": {
+            "backend": "google",
+            "marian_model": None,
+            "memo": True,
+            "http_url": "http://127.0.0.1:5000/translate",
+            "http_api_key": None,
+            "concurrency": 4,
+            "retries": 3,
+            "backoff": 0.5
+        },
+        "storyteller": {
+            "context_tokens": 1024,
+            "summary_tokens": 96,
+            "stop_strings": ["Студент:", "Игрок:", "Player:", "\n\n"],
+            "stop_on_frames": True
+        },
         "paths": {
             "output_dir": "outputs",
             "sessions_dir": "sessions",
-            "logs_dir": "logs"
+            "logs_dir": "logs",
+            "cache_dir": "cache"
+        },
+        "startup": {
+            "background_warmup": True
+        },
+        "cache": {
+            "embedding_max_entries": 64,
+            "embedding_disk": True,
+            "embedding_disk_max_mb": 128,
+            "frame_max_mb": 512
         }
     }
 
@@ -36,3 +36,36 @@ class Storage:
             saved_paths.append(path)
             
         return session_dir
+
+def mark_used(path):
+    """Touches a cache file so evict_lru sees it as recently used."""
+    os.utime(path, None)
+
+def evict_lru(directory, suffixes, max_bytes):
+    """
+    Keeps the files with the given suffixes in directory under max_bytes in total by
+    removing the least recently used ones (oldest mtime, see mark_used) first.
+    """
+    files = []
+    total = 0
+    for name in os.listdir(directory):
+        if not name.endswith(tuple(suffixes)):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    # Oldest access first
+    files.sort()
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            print(f"Failed to evict cached file {path}: {e}")
@@ -17,6 +17,7 @@ import warnings
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict
 import random
+import time
 
 warnings.filterwarnings('ignore')
 
@@ -43,6 +44,23 @@ class Config:
     CPU_STEPS = 15  # Меньше шагов для CPU
     CPU_SIZE = 256  # Меньший размер для CPU
     
+    # Аниматик: промежуточные кадры между сценами
+    ANIMATIC_FRAMES_BETWEEN = 6
+    ANIMATIC_FPS = 8
+    ANIMATIC_STEPS = 10  # Длина расписания шумов
+    ANIMATIC_STRENGTH = 0.3  # Доля расписания, которая реально прогоняется (3 шага из 10)
+    
+    # Черновик -> увеличение: сцены рендерятся маленькими, принятые увеличиваются
+    UPSCALE_SIZE = 768
+    CPU_UPSCALE_SIZE = 512
+    UPSCALE_STEPS = 20
+    UPSCALE_STRENGTH = 0.35
+    
+    # Best-of-N: черновики кандидатов ранжируются CLIP, дорабатывается только лучший
+    NUM_CANDIDATES = 1  # 1 - режим выключен
+    CANDIDATE_DRAFT_FRACTION = 0.3  # Доля шагов, которую проходят все кандидаты
+    CLIP_MODEL = "openai/clip-vit-base-patch32"
+    
     # Стили
     STYLES = {
         "Cinematic": "cinematic lighting, movie scene, film grain, dramatic lighting",
@@ -115,6 +133,52 @@ def create_placeholder_image(text: str, size: Tuple[int, int] = (384, 384)) -> I
     
     return img
 
+def slerp(t: float, v0: torch.Tensor, v1: torch.Tensor, dot_threshold: float = 0.9995) -> torch.Tensor:
+    """Сферическая интерполяция тензоров (шум, латенты); почти коллинеарные - линейно"""
+    a, b = v0.float(), v1.float()
+    dot = torch.sum(a * b) / (a.norm() * b.norm())
+    if torch.abs(dot) > dot_threshold:
+        return torch.lerp(a, b, t).to(v0.dtype)
+    theta = torch.acos(dot)
+    sin_theta = torch.sin(theta)
+    result = (torch.sin((1 - t) * theta) * a + torch.sin(t * theta) * b) / sin_theta
+    return result.to(v0.dtype)
+
+class AnimaticWriter:
+    """Пишет кадры аниматика по одному: MP4 через imageio, иначе анимированный WebP"""
+    
+    def __init__(self, path_stem: Path, fps: int):
+        self.fps = fps
+        self.frames = []
+        try:
+            import imageio.v2 as imageio
+            self.path = path_stem.with_suffix(".mp4")
+            self.writer = imageio.get_writer(str(self.path), fps=fps, codec="libx264", macro_block_size=1)
+        except Exception as e:
+            # Нет imageio/ffmpeg - собираем кадры и сохраняем WebP средствами PIL
+            print(f"MP4 недоступен ({e}), аниматик будет сохранен в WebP")
+            self.path = path_stem.with_suffix(".webp")
+            self.writer = None
+    
+    def append(self, image: Image.Image):
+        if self.writer is not None:
+            self.writer.append_data(np.asarray(image.convert("RGB")))
+        else:
+            self.frames.append(image.convert("RGB"))
+    
+    def close(self) -> Path:
+        if self.writer is not None:
+            self.writer.close()
+        elif self.frames:
+            self.frames[0].save(
+                self.path,
+                save_all=True,
+                append_images=self.frames[1:],
+                duration=int(1000 / self.fps),
+                loop=0
+            )
+        return self.path
+
 # ==================== ОБРАБОТКА ТЕКСТА ====================
 
 class TextProcessor:
@@ -204,6 +268,14 @@ class StoryImageGenerator:
         self.is_loaded = False
         self.current_model = None
         
+        # Состояние кадров последней последовательности (шум, латенты, эмбеддинги) для аниматика
+        self.last_frame_state = None
+        self.last_sequence_states = []
+        
+        # CLIP для ранжирования кандидатов, загружается при первом использовании
+        self.clip_model = None
+        self.clip_processor = None
+        
         self.text_processor = TextProcessor()
         
     def load_model(self, model_id: str = None, progress_callback=None):
@@ -269,9 +341,10 @@ class StoryImageGenerator:
         num_inference_steps: int = None,
         height: int = None,
         width: int = None,
+        num_candidates: int = 1,
         progress_callback=None
     ) -> Image.Image:
-        """Генерирует одно изображение"""
+        """Генерирует одно изображение; при num_candidates > 1 - лучшее из N черновиков"""
         
         if not self.is_loaded:
             if not self.load_model(progress_callback=progress_callback):
@@ -293,10 +366,31 @@ class StoryImageGenerator:
         
         negative = negative_prompt or "blurry, low quality, distorted, ugly, bad anatomy, watermark, signature"
         
+        self.last_frame_state = None
         try:
             if progress_callback:
                 progress_callback(0.3, "Генерация...")
             
+            if num_candidates > 1:
+                result = self._generate_best_of(prompt, negative, seed, steps, h, w, num_candidates, progress_callback)
+                if progress_callback:
+                    progress_callback(1.0, "Готово!")
+                flush_memory()
+                return result
+            
+            from diffusers.utils.torch_utils import randn_tensor
+            
+            # Начальный шум берем тем же способом, что и сам pipeline, - результат не меняется,
+            # а шум сохраняется для интерполяции
+            device = self.pipeline._execution_device
+            shape = (1, self.pipeline.unet.config.in_channels, h // self.pipeline.vae_scale_factor, w // self.pipeline.vae_scale_factor)
+            noise = randn_tensor(shape, generator=generator, device=device, dtype=self.pipeline.unet.dtype)
+            
+            final = {}
+            def capture_final(pipe, step_index, timestep, callback_kwargs):
+                final.update(callback_kwargs)
+                return callback_kwargs
+            
             with torch.no_grad():
                 result = self.pipeline(
                     prompt=prompt,
@@ -305,9 +399,20 @@ class StoryImageGenerator:
                     guidance_scale=7.5,
                     generator=generator,
                     height=h,
-                    width=w
+                    width=w,
+                    latents=noise,
+                    callback_on_step_end=capture_final,
+                    callback_on_step_end_tensor_inputs=["latents", "prompt_embeds"]
                 ).images[0]
             
+            # prompt_embeds здесь - [negative, positive], как их видит UNet
+            self.last_frame_state = {
+                "noise": noise.cpu(),
+                "latents": final["latents"].cpu(),
+                "prompt_embeds": final["prompt_embeds"].cpu(),
+                "image": result
+            }
+            
             if progress_callback:
                 progress_callback(1.0, "Готово!")
             
@@ -324,9 +429,10 @@ class StoryImageGenerator:
         num_scenes: int = 4,
         style: str = "",
         seed_start: int = 42,
+        num_candidates: int = Config.NUM_CANDIDATES,
         progress_callback=None
     ) -> Tuple[List[Image.Image], List[str], List[str]]:
-        """Генерирует последовательность изображений"""
+        """Генерирует последовательность изображений (num_candidates > 1 - лучшее из N на сцену)"""
         
         # Анализ и разбиение
         scenes = self.text_processor.split_story(story_text, num_scenes)
@@ -334,6 +440,7 @@ class StoryImageGenerator:
         
         images = []
         prompts = []
+        self.last_sequence_states = []
         
         for i, scene in enumerate(scenes):
             if progress_callback:
@@ -348,14 +455,215 @@ class StoryImageGenerator:
             img = self.generate_image(
                 enhanced, 
                 seed=seed,
+                num_candidates=num_candidates,
                 progress_callback=lambda p, t: progress_callback(
                     (i + p) / num_scenes, 
                     f"Сцена {i+1}: {t}"
                 ) if progress_callback else None
             )
             images.append(img)
+            self.last_sequence_states.append(self.last_frame_state)
         
         return images, prompts, scenes
+    
+    def render_animatic(
+        self,
+        frames_between: int = Config.ANIMATIC_FRAMES_BETWEEN,
+        fps: int = Config.ANIMATIC_FPS,
+        steps: int = Config.ANIMATIC_STEPS,
+        strength: float = Config.ANIMATIC_STRENGTH,
+        progress_callback=None
+    ) -> Optional[Path]:
+        """
+        Аниматик по последней последовательности: между соседними сценами шум и латенты
+        интерполируются по сфере (slerp), эмбеддинги текста - линейно. Промежуточный кадр
+        получает лишь strength * steps шагов доуточнения, декодируются только промежуточные
+        кадры, и они сразу пишутся в файл.
+        """
+        states = self.last_sequence_states
+        if not self.is_loaded or len(states) < 2:
+            return None
+        
+        writer = AnimaticWriter(Config.OUTPUT_DIR / f"animatic_{time.strftime('%Y%m%d_%H%M%S')}", fps)
+        pairs = list(zip(states, states[1:]))
+        for pair_index, (start, end) in enumerate(pairs):
+            if start is not None:
+                writer.append(start["image"])
+            if start is None or end is None:
+                # Сцена не сгенерировалась - переход пропускаем
+                continue
+            for k in range(1, frames_between + 1):
+                t = k / (frames_between + 1)
+                if progress_callback:
+                    progress_callback(
+                        (pair_index + t) / len(pairs),
+                        f"Переход {pair_index + 1}/{len(pairs)}, кадр {k}/{frames_between}"
+                    )
+                writer.append(self._render_inbetween(start, end, t, steps, strength))
+        if states[-1] is not None:
+            writer.append(states[-1]["image"])
+        
+        flush_memory()
+        return writer.close()
+    
+    def upscale_scene(
+        self,
+        index: int,
+        size: int = None,
+        steps: int = Config.UPSCALE_STEPS,
+        strength: float = Config.UPSCALE_STRENGTH,
+        seed: int = None
+    ) -> Optional[Image.Image]:
+        """
+        Второй этап режима черновиков: увеличивает принятую сцену. Латенты сцены растягиваются
+        до нужного размера, затем strength * steps шагов img2img возвращают детали.
+        VAE декодирует по тайлам, поэтому пик памяти остается в пределах бюджета CPU-режима.
+        """
+        states = self.last_sequence_states
+        if not self.is_loaded or index >= len(states) or states[index] is None:
+            return None
+        state = states[index]
+        size = size or (Config.CPU_UPSCALE_SIZE if self.use_cpu_optimization else Config.UPSCALE_SIZE)
+        
+        device = self.pipeline._execution_device
+        dtype = self.pipeline.unet.dtype
+        # Стороны кратны 64 px, чтобы блоки UNet совпадали по размеру
+        latent_size = max(8, size // 64 * 8)
+        scale = latent_size / max(state["latents"].shape[-2:])
+        target = [max(8, round(side * scale / 8) * 8) for side in state["latents"].shape[-2:]]
+        latents = torch.nn.functional.interpolate(state["latents"].float(), size=target, mode="bicubic").to(device, dtype)
+        
+        generator = torch.Generator(device="cpu").manual_seed(seed or random.randint(0, 1000000))
+        noise = torch.randn(latents.shape, generator=generator).to(device, dtype)
+        
+        self.pipeline.vae.enable_tiling()
+        try:
+            image = self._refine_latents(latents, noise, state["prompt_embeds"].to(device, dtype), steps, strength)
+        finally:
+            self.pipeline.vae.disable_tiling()
+        flush_memory()
+        return image
+    
+    def _render_inbetween(self, start: Dict, end: Dict, t: float, steps: int, strength: float) -> Image.Image:
+        """Промежуточный кадр: интерполяция и несколько шагов img2img от интерполированных латентов"""
+        device = self.pipeline._execution_device
+        dtype = self.pipeline.unet.dtype
+        noise = slerp(t, start["noise"], end["noise"]).to(device, dtype)
+        latents = slerp(t, start["latents"], end["latents"]).to(device, dtype)
+        prompt_embeds = torch.lerp(start["prompt_embeds"].float(), end["prompt_embeds"].float(), t).to(device, dtype)
+        return self._refine_latents(latents, noise, prompt_embeds, steps, strength)
+    
+    def _refine_latents(self, latents: torch.Tensor, noise: torch.Tensor, prompt_embeds: torch.Tensor, steps: int, strength: float) -> Image.Image:
+        """Зашумляет латенты до strength, прогоняет хвост расписания и декодирует результат"""
+        run_steps = max(1, int(steps * strength))
+        scheduler, timesteps = self._tail_schedule(steps, run_steps)
+        latents = scheduler.add_noise(latents, noise, timesteps[:1])
+        latents, _ = self._denoise(latents, prompt_embeds, scheduler, timesteps)
+        return self._decode(latents)[0]
+    
+    def _generate_best_of(
+        self,
+        prompt: str,
+        negative: str,
+        seed: int,
+        steps: int,
+        height: int,
+        width: int,
+        num_candidates: int,
+        progress_callback=None
+    ) -> Image.Image:
+        """
+        Best-of-N: N кандидатов (seed, seed+1, ...) одним батчем проходят первые
+        CANDIDATE_DRAFT_FRACTION шагов, CLIP оценивает их предсказанные итоговые изображения,
+        оставшиеся шаги получает только победитель. Кандидат seed совпадает с обычной генерацией
+        на этих шагах.
+        """
+        from diffusers.utils.torch_utils import randn_tensor
+        
+        device = self.pipeline._execution_device
+        dtype = self.pipeline.unet.dtype
+        prompt_embeds, negative_embeds = self.pipeline.encode_prompt(prompt, device, num_candidates, True, negative)
+        embeds = torch.cat([negative_embeds, prompt_embeds])
+        
+        generator_device = self.device if not self.use_cpu_optimization else "cpu"
+        generators = [torch.Generator(device=generator_device).manual_seed(seed + k) for k in range(num_candidates)]
+        shape = (num_candidates, self.pipeline.unet.config.in_channels, height // self.pipeline.vae_scale_factor, width // self.pipeline.vae_scale_factor)
+        noise = randn_tensor(shape, generator=generators, device=device, dtype=dtype)
+        
+        scheduler = self.pipeline.scheduler
+        scheduler.set_timesteps(steps, device=device)
+        timesteps = scheduler.timesteps
+        draft_steps = max(1, int(len(timesteps) * Config.CANDIDATE_DRAFT_FRACTION))
+        
+        if progress_callback:
+            progress_callback(0.3, f"Черновики {num_candidates} кандидатов...")
+        latents = noise * scheduler.init_noise_sigma
+        latents, x0 = self._denoise(latents, embeds, scheduler, timesteps[:draft_steps], return_x0=True)
+        
+        scores = self._clip_scores(prompt, self._decode(x0))
+        winner = int(torch.argmax(scores))
+        print(f"CLIP: {[round(float(score), 2) for score in scores]}, лучший кандидат {winner + 1} (seed {seed + winner})")
+        
+        if progress_callback:
+            progress_callback(0.6, f"Доработка кандидата {winner + 1}...")
+        # Победитель продолжает с того же места расписания, как img2img без добавления шума
+        scheduler, tail = self._tail_schedule(steps, len(timesteps) - draft_steps)
+        winner_embeds = torch.cat([negative_embeds[winner:winner + 1], prompt_embeds[winner:winner + 1]])
+        final_latents, _ = self._denoise(latents[winner:winner + 1], winner_embeds, scheduler, tail)
+        result = self._decode(final_latents)[0]
+        
+        self.last_frame_state = {
+            "noise": noise[winner:winner + 1].cpu(),
+            "latents": final_latents.cpu(),
+            "prompt_embeds": winner_embeds.cpu(),
+            "image": result
+        }
+        return result
+    
+    def _tail_schedule(self, steps: int, run_steps: int):
+        """Свежий планировщик и последние run_steps его шагов (старт с середины расписания)"""
+        device = self.pipeline._execution_device
+        scheduler = self.pipeline.scheduler.__class__.from_config(self.pipeline.scheduler.config)
+        scheduler.set_timesteps(steps, device=device)
+        start_index = max(0, len(scheduler.timesteps) - run_steps * scheduler.order)
+        if hasattr(scheduler, "set_begin_index"):
+            scheduler.set_begin_index(start_index)
+        return scheduler, scheduler.timesteps[start_index:]
+    
+    def _denoise(self, latents: torch.Tensor, prompt_embeds: torch.Tensor, scheduler, timesteps, return_x0: bool = False):
+        """
+        Цикл денойзинга с CFG; prompt_embeds - [negative, positive]. При return_x0 возвращает
+        также оценку итоговых латентов по последнему шагу (x0 = (x_t - sqrt(1-a) * eps) / sqrt(a)).
+        """
+        guidance_scale = 7.5
+        x0 = None
+        with torch.no_grad():
+            for timestep in timesteps:
+                model_input = scheduler.scale_model_input(torch.cat([latents] * 2), timestep)
+                noise_pred = self.pipeline.unet(model_input, timestep, encoder_hidden_states=prompt_embeds).sample
+                noise_uncond, noise_text = noise_pred.chunk(2)
+                noise_pred = noise_uncond + guidance_scale * (noise_text - noise_uncond)
+                if return_x0:
+                    alpha = scheduler.alphas_cumprod[int(timestep)].to(latents.device, latents.dtype)
+                    x0 = (latents - (1 - alpha).sqrt() * noise_pred) / alpha.sqrt()
+                latents = scheduler.step(noise_pred, timestep, latents).prev_sample
+        return latents, x0
+    
+    def _decode(self, latents: torch.Tensor) -> List[Image.Image]:
+        with torch.no_grad():
+            vae = self.pipeline.vae
+            decoded = vae.decode(latents / vae.config.scaling_factor, return_dict=False)[0]
+        return self.pipeline.image_processor.postprocess(decoded, output_type="pil")
+    
+    def _clip_scores(self, prompt: str, images: List[Image.Image]) -> torch.Tensor:
+        """Сходство промпта со всеми изображениями одним батчем CLIP"""
+        if self.clip_model is None:
+            from transformers import CLIPModel, CLIPProcessor
+            self.clip_model = CLIPModel.from_pretrained(Config.CLIP_MODEL, cache_dir=Config.CACHE_DIR).eval()
+            self.clip_processor = CLIPProcessor.from_pretrained(Config.CLIP_MODEL, cache_dir=Config.CACHE_DIR)
+        inputs = self.clip_processor(text=[prompt], images=images, return_tensors="pt", padding=True, truncation=True)
+        with torch.no_grad():
+            return self.clip_model(**inputs).logits_per_image[:, 0]
 
 # ==================== ИНТЕРФЕЙС ====================
 
@@ -488,6 +796,15 @@ def create_interface():
                         precision=0
                     )
                     
+                    candidates_slider = gr.Slider(
+                        minimum=1,
+                        maximum=6,
+                        value=Config.NUM_CANDIDATES,
+                        step=1,
+                        label="Кандидатов на сцену",
+                        info="Черновики ранжируются CLIP, до конца дорабатывается лучший"
+                    )
+                    
                     with gr.Row():
                         height_dropdown = gr.Dropdown(
                             choices=[256, 384, 512],
@@ -569,6 +886,36 @@ def create_interface():
                 with gr.Row(visible=False) as download_row:
                     download_btn = gr.Button("💾 Скачать все изображения", variant="secondary")
                     zip_output = gr.File(label="Архив")
+                
+                # Увеличение принятой сцены
+                with gr.Accordion("🔍 Увеличить сцену (черновик -> финал)", open=False):
+                    with gr.Row():
+                        upscale_scene_input = gr.Number(
+                            value=1,
+                            label="Номер сцены",
+                            precision=0
+                        )
+                        upscale_btn = gr.Button("🔍 Увеличить", variant="secondary")
+                
+                # Аниматик
+                with gr.Accordion("🎞️ Аниматик (плавные переходы между сценами)", open=False):
+                    with gr.Row():
+                        frames_between_slider = gr.Slider(
+                            minimum=1,
+                            maximum=16,
+                            value=Config.ANIMATIC_FRAMES_BETWEEN,
+                            step=1,
+                            label="Промежуточных кадров"
+                        )
+                        fps_slider = gr.Slider(
+                            minimum=4,
+                            maximum=24,
+                            value=Config.ANIMATIC_FPS,
+                            step=1,
+                            label="Кадров в секунду"
+                        )
+                    animatic_btn = gr.Button("🎬 Создать аниматик", variant="secondary")
+                    animatic_output = gr.File(label="Аниматик (MP4/WebP)")
         
         # Функции обработки
         
@@ -600,7 +947,7 @@ def create_interface():
             """
             return html
         
-        def generate_story(story, num_scenes_val, style, seed, height, width, cpu_optimization):
+        def generate_story(story, num_scenes_val, style, seed, height, width, cpu_optimization, num_candidates):
             """Генерация истории"""
             if not story or len(story) < 10:
                 return [gr.update()] * 16 + ["Введите сюжет (минимум 10 символов)"]
@@ -621,6 +968,7 @@ def create_interface():
                     num_scenes=num_scenes_val,
                     style=style,
                     seed_start=int(seed),
+                    num_candidates=int(num_candidates),
                     progress_callback=progress_callback
                 )
                 
@@ -646,6 +994,33 @@ def create_interface():
             except Exception as e:
                 return [gr.update()] * 16 + [f"❌ Ошибка: {str(e)}"]
         
+        def upscale_scene(scene_number):
+            """Увеличивает выбранную сцену и подменяет ее изображение"""
+            index = int(scene_number) - 1
+            updates = [gr.update() for _ in range(8)]
+            if index < 0 or index >= len(generator.last_sequence_states):
+                return updates + [f"Нет сцены с номером {int(scene_number)}"]
+            try:
+                image = generator.upscale_scene(index)
+                if image is None:
+                    return updates + ["❌ Эту сцену нельзя увеличить"]
+                updates[index] = image
+                return updates + [f"✅ Сцена {index + 1} увеличена до {image.width}x{image.height}"]
+            except Exception as e:
+                return updates + [f"❌ Ошибка: {str(e)}"]
+        
+        def export_animatic(frames_between, fps):
+            """Экспорт аниматика по последней сгенерированной истории"""
+            if len(generator.last_sequence_states) < 2:
+                return None, "Сначала сгенерируйте историю минимум из двух сцен"
+            try:
+                path = generator.render_animatic(frames_between=int(frames_between), fps=int(fps))
+                if path is None:
+                    return None, "❌ Не удалось создать аниматик"
+                return str(path), f"✅ Аниматик сохранен: {path}"
+            except Exception as e:
+                return None, f"❌ Ошибка: {str(e)}"
+        
         def clear_all():
             """Очистка всех полей"""
             updates = ["", 4, "Cinematic", 42, 384, 384, True]  # Inputs
@@ -673,11 +1048,23 @@ def create_interface():
         generate_btn.click(
             fn=generate_story,
             inputs=[story_input, num_scenes, style_dropdown, seed_input, 
-                   height_dropdown, width_dropdown, cpu_opt],
+                   height_dropdown, width_dropdown, cpu_opt, candidates_slider],
             outputs=[item for pair in gallery_outputs for item in [pair[0], pair[1]]] + 
                    [prompts_output, download_row, status_text, progress_bar]
         )
         
+        upscale_btn.click(
+            fn=upscale_scene,
+            inputs=[upscale_scene_input],
+            outputs=[pair[1] for pair in gallery_outputs] + [status_text]
+        )
+        
+        animatic_btn.click(
+            fn=export_animatic,
+            inputs=[frames_between_slider, fps_slider],
+            outputs=[animatic_output, status_text]
+        )
+        
         clear_btn.click(
             fn=clear_all,
             inputs=[],